@@ -1,28 +1,58 @@
+import random
+
 CONSECUTIVE_MARKS_TO_WIN = 5
 IN_PROGRESS = -1
 DRAW = 0
+DIRECTIONS = [(0, 1), (1, 1), (1, 0), (1, -1)]
 
 
 # hàm kiểm tra trạng thái hiện tại của bàn cờ
 # trả về số hiệu người chơi thắng hoặc các hằng số biểu thị hòa hay chưa kết thúc
 def check_board_status(board):
-    has_empty_square = False
-    for i in range(len(board)):
-        for j in range(len(board[0])):
-            if board[i][j] > 0:
-                directions = [(0, 1), (1, 1), (1, 0), (1, -1)]
-                for d in directions:
-                    i_, j_ = i, j
-                    consecutive = 0
-                    while 0 <= i_ < len(board) and 0 <= j_ < len(board[0]) and board[i_][j_] == board[i][j]:
-                        consecutive += 1
-                        i_ += d[0]
-                        j_ += d[1]
-                    if consecutive >= CONSECUTIVE_MARKS_TO_WIN:
-                        return board[i][j]
-            else:
-                has_empty_square = True
-    return IN_PROGRESS if has_empty_square else DRAW
+    bitboard = BitBoard.from_board(board)
+    for player in (1, 2):
+        if bitboard.has_five(player):
+            return player
+    return IN_PROGRESS if bitboard.empty_mask() else DRAW
+
+
+# hàm đếm số ô liên tiếp có quân mark (mặc định cùng màu với ô (i, j)) theo hướng d, không tính ô (i, j)
+def count_consecutive(board, i, j, d, mark=None):
+    if mark is None:
+        mark = board[i][j]
+    count = 0
+    i_, j_ = i + d[0], j + d[1]
+    while 0 <= i_ < len(board) and 0 <= j_ < len(board[0]) and board[i_][j_] == mark:
+        count += 1
+        i_ += d[0]
+        j_ += d[1]
+    return count
+
+
+# hàm kiểm tra trạng thái bàn cờ ngay sau nước đi move
+# chỉ xét 4 đường đi qua move thay vì duyệt cả bàn cờ, empty_count là số ô còn trống sau nước đi đó
+def check_move_status(board, move, empty_count):
+    i, j = move[0], move[1]
+    mark = board[i][j]
+    for d in DIRECTIONS:
+        consecutive = 1 + count_consecutive(board, i, j, d) + count_consecutive(board, i, j, (-d[0], -d[1]))
+        if consecutive >= CONSECUTIVE_MARKS_TO_WIN:
+            return mark
+    return IN_PROGRESS if empty_count > 0 else DRAW
+
+
+# hàm kiểm tra nếu đánh quân mark vào ô trống (i, j) thì có đủ số quân liên tiếp để thắng hay không
+def makes_five(board, i, j, mark):
+    for d in DIRECTIONS:
+        if 1 + count_consecutive(board, i, j, d, mark) + count_consecutive(board, i, j, (-d[0], -d[1]), mark) \
+                >= CONSECUTIVE_MARKS_TO_WIN:
+            return True
+    return False
+
+
+# hàm đếm số ô còn trống trên bàn cờ
+def count_empty_positions(board):
+    return sum(row.count(0) for row in board)
 
 
 # hàm kiểm tra xem bàn cờ có trống hay không
@@ -35,38 +65,390 @@ def get_empty_positions(board):
     return [(i, j) for i in range(len(board)) for j in range(len(board[0])) if board[i][j] == 0]
 
 
-# hàm lấy những ô còn trống nằm cạnh những ô đã được đánh
-def get_potential_moves(board):
-    possible_moves = []
-    # duyệt cả bàn cờ
-    for row in range(len(board)):
-        for col in range(len(board[row])):
-            # nếu ô hiện tại đã đánh rồi, bỏ qua
-            if board[row][col] > 0:
-                continue
-            # ngược lại nếu chưa được đánh, ta sẽ kiểm tra các vị trí xung
-            # quanh ô này đã được đánh chưa, nếu có thì thêm vào possible_moves
-            if row > 0:
-                if col > 0:
-                    if board[row - 1][col - 1] > 0 or board[row][col - 1] > 0:
-                        possible_moves.append((row, col))
-                if col < len(board[row]) - 1:
-                    if board[row - 1][col + 1] > 0 or board[row][col + 1] > 0:
-                        possible_moves.append((row, col))
-                if board[row - 1][col] > 0:
-                    possible_moves.append((row, col))
-            if row < len(board) - 1:
-                if col > 0:
-                    if board[row + 1][col - 1] > 0 or board[row][col - 1] > 0:
-                        possible_moves.append((row, col))
-                if col < len(board[row]) - 1:
-                    if board[row + 1][col + 1] > 0 or board[row][col + 1] > 0:
-                        possible_moves.append((row, col))
-                if board[row + 1][col] > 0:
-                    possible_moves.append((row, col))
-    return possible_moves
+# hàm lấy những ô còn trống nằm cách những ô đã được đánh không quá radius ô
+# mỗi ô chỉ xuất hiện một lần, theo thứ tự duyệt bàn cờ từ trên xuống dưới, trái sang phải
+def get_potential_moves(board, radius=1):
+    bitboard = BitBoard.from_board(board)
+    return bitboard.cells(bitboard.neighbour_mask(radius))
 
 
 # tạo một bản sao của mảng hai chiều chứa bàn cờ
 def clone_board(board):
     return [[board[i][j] for j in range(len(board[i]))] for i in range(len(board))]
+
+
+# các độ lệch tới những ô lân cận trong bán kính radius, tính sẵn cho từng bán kính
+_NEIGHBOUR_OFFSETS = {}
+
+
+def get_neighbour_offsets(radius):
+    offsets = _NEIGHBOUR_OFFSETS.get(radius)
+    if offsets is None:
+        offsets = _NEIGHBOUR_OFFSETS[radius] = [(di, dj) for di in range(-radius, radius + 1)
+                                                for dj in range(-radius, radius + 1) if di != 0 or dj != 0]
+    return offsets
+
+
+# tập các nước đi tiềm năng (ô trống cách một quân cờ không quá radius ô), được cập nhật dần
+# sau mỗi nước đánh (place) hoặc hoàn tác (undo) thay vì duyệt lại cả bàn cờ
+# các nước đi được lưu trong một list kèm chỉ số để thêm, xóa và chọn ngẫu nhiên trong O(1)
+class MoveFrontier:
+    def __init__(self, rows, cols, radius=1):
+        self.rows = rows
+        self.cols = cols
+        self.radius = radius
+        self.offsets = get_neighbour_offsets(radius)
+        self.occupied = [[False] * cols for _ in range(rows)]
+        self.counts = [[0] * cols for _ in range(rows)]  # số quân cờ nằm trong vùng lân cận của mỗi ô
+        self.moves = []
+        self.index = {}  # vị trí của mỗi nước đi trong self.moves
+
+    @staticmethod
+    def from_board(board, radius=1):
+        frontier = MoveFrontier(len(board), len(board[0]), radius)
+        for i in range(len(board)):
+            for j in range(len(board[i])):
+                if board[i][j] > 0:
+                    frontier.place(i, j)
+        return frontier
+
+    def __len__(self):
+        return len(self.moves)
+
+    def __iter__(self):
+        return iter(self.moves)
+
+    def __contains__(self, move):
+        return move in self.index
+
+    def _add(self, move):
+        if move not in self.index:
+            self.index[move] = len(self.moves)
+            self.moves.append(move)
+
+    # xóa bằng cách đổi chỗ với phần tử cuối cùng
+    def _remove(self, move):
+        pos = self.index.pop(move, None)
+        if pos is None:
+            return
+        last = self.moves.pop()
+        if pos < len(self.moves):
+            self.moves[pos] = last
+            self.index[last] = pos
+
+    # cập nhật sau khi ô (i, j) được đánh
+    def place(self, i, j):
+        self.occupied[i][j] = True
+        self._remove((i, j))
+        for di, dj in self.offsets:
+            i_, j_ = i + di, j + dj
+            if 0 <= i_ < self.rows and 0 <= j_ < self.cols:
+                self.counts[i_][j_] += 1
+                if not self.occupied[i_][j_]:
+                    self._add((i_, j_))
+
+    # cập nhật sau khi ô (i, j) được trả lại trạng thái trống
+    def undo(self, i, j):
+        self.occupied[i][j] = False
+        for di, dj in self.offsets:
+            i_, j_ = i + di, j + dj
+            if 0 <= i_ < self.rows and 0 <= j_ < self.cols:
+                self.counts[i_][j_] -= 1
+                if self.counts[i_][j_] == 0:
+                    self._remove((i_, j_))
+        if self.counts[i][j] > 0:
+            self._add((i, j))
+
+    # các nước đi theo thứ tự duyệt bàn cờ, giống với get_potential_moves
+    def sorted_moves(self):
+        return sorted(self.moves)
+
+
+ZOBRIST_SEED = 20231123  # cố định để mã băm giống nhau giữa các lần chạy và giữa các tiến trình
+
+
+# bảng khóa Zobrist: mỗi ô ứng với mỗi người chơi có một số ngẫu nhiên 64 bit
+# mã băm của bàn cờ là XOR các khóa của những ô đã đánh, nên có thể cập nhật trong O(1) sau mỗi nước đi
+class ZobristTable:
+    def __init__(self, rows, cols):
+        rng = random.Random(ZOBRIST_SEED)
+        self.rows = rows
+        self.cols = cols
+        self.keys = [None] + [[[rng.getrandbits(64) for _ in range(cols)] for _ in range(rows)] for _ in (1, 2)]
+        self.turn_key = rng.getrandbits(64)  # XOR thêm vào khi cần phân biệt lượt đi
+
+    def hash_board(self, board):
+        h = 0
+        for i in range(len(board)):
+            for j in range(len(board[i])):
+                if board[i][j] > 0:
+                    h ^= self.keys[board[i][j]][i][j]
+        return h
+
+
+_ZOBRIST_TABLES = {}
+
+
+# lấy bảng khóa Zobrist cho kích cỡ bàn cờ, mỗi kích cỡ chỉ tạo một lần
+def get_zobrist_table(rows, cols):
+    table = _ZOBRIST_TABLES.get((rows, cols))
+    if table is None:
+        table = _ZOBRIST_TABLES[(rows, cols)] = ZobristTable(rows, cols)
+    return table
+
+
+# thế cờ dùng chung cho các engine và vòng lặp ván đấu: giữ bàn cờ cùng các thông tin được cập nhật dần sau mỗi
+# nước đánh (play) và hoàn tác (undo) thay vì tính lại từ cả bàn cờ: mã băm Zobrist, tập nước đi tiềm năng,
+# số ô trống, trạng thái thắng thua và người đi tiếp theo
+# nếu gán evaluator (đối tượng có place(board, i, j) và undo(), chẳng hạn bộ đánh giá tăng dần của minimax)
+# thì bộ đánh giá đó cũng được cập nhật cùng lúc
+class Position:
+    def __init__(self, board, radius=1):
+        self.board = clone_board(board)
+        self.rows = len(board)
+        self.cols = len(board[0])
+        self.zobrist = get_zobrist_table(self.rows, self.cols)
+        self.hash = self.zobrist.hash_board(self.board)
+        self.frontier = MoveFrontier.from_board(self.board, radius)
+        self.empty_count = count_empty_positions(self.board)
+        self.status = check_board_status(self.board)
+        # X đi trước nên đến lượt O khi số quân X nhiều hơn
+        x_count = sum(row.count(1) for row in self.board)
+        self.turn = 1 if x_count <= self.rows * self.cols - self.empty_count - x_count else 2
+        self.evaluator = None
+        self.history = []  # (hàng, cột, trạng thái trước nước đi), phục vụ undo
+
+    @staticmethod
+    def empty(rows, cols=None, radius=1):
+        return Position([[0] * (cols or rows) for _ in range(rows)], radius)
+
+    # đánh quân mark (mặc định là người đi tiếp theo) vào ô trống move
+    def play(self, move, mark=None):
+        i, j = move
+        if mark is None:
+            mark = self.turn
+        self.history.append((i, j, self.status))
+        self.board[i][j] = mark
+        self.hash ^= self.zobrist.keys[mark][i][j]
+        self.frontier.place(i, j)
+        self.empty_count -= 1
+        if self.evaluator is not None:
+            self.evaluator.place(self.board, i, j)
+        if self.status == IN_PROGRESS:
+            self.status = check_move_status(self.board, move, self.empty_count)
+        self.turn = 3 - mark
+
+    # hoàn tác nước đánh cuối cùng và trả về nước đi đó
+    def undo(self):
+        i, j, self.status = self.history.pop()
+        mark = self.board[i][j]
+        self.hash ^= self.zobrist.keys[mark][i][j]
+        self.board[i][j] = 0
+        self.frontier.undo(i, j)
+        self.empty_count += 1
+        if self.evaluator is not None:
+            self.evaluator.undo()
+        self.turn = mark
+        return i, j
+
+    # nếu quân mark (mặc định là người đi tiếp theo) đánh vào ô trống move thì có thắng ngay hay không
+    def is_winning_move(self, move, mark=None):
+        return makes_five(self.board, move[0], move[1], self.turn if mark is None else mark)
+
+
+# các phép đối xứng của bàn cờ (nhóm D4): 0 - giữ nguyên, 1 - lật trái phải, 2 - lật trên dưới, 3 - xoay 180 độ,
+# 4 - chuyển vị, 5 - xoay 90 độ theo chiều kim đồng hồ, 6 - xoay 90 độ ngược chiều kim đồng hồ,
+# 7 - lấy đối xứng qua đường chéo phụ; bàn cờ không vuông chỉ dùng được 4 phép đầu
+SYMMETRY_COUNT = 8
+INVERSE_SYMMETRY = [0, 1, 2, 3, 4, 6, 5, 7]  # phép đối xứng ngược của mỗi phép
+
+
+# các phép đối xứng áp dụng được cho bàn cờ kích cỡ rows x cols
+def get_symmetries(rows, cols):
+    return range(SYMMETRY_COUNT if rows == cols else 4)
+
+
+# ảnh của nước đi move qua phép đối xứng symmetry
+def transform_move(move, symmetry, rows, cols):
+    i, j = move
+    if symmetry == 0:
+        return i, j
+    if symmetry == 1:
+        return i, cols - 1 - j
+    if symmetry == 2:
+        return rows - 1 - i, j
+    if symmetry == 3:
+        return rows - 1 - i, cols - 1 - j
+    if symmetry == 4:
+        return j, i
+    if symmetry == 5:
+        return j, rows - 1 - i
+    if symmetry == 6:
+        return cols - 1 - j, i
+    return cols - 1 - j, rows - 1 - i
+
+
+# mã băm chính tắc của bàn cờ: mã băm Zobrist nhỏ nhất trong các ảnh đối xứng của bàn cờ
+# trả về (mã băm, phép đối xứng biến bàn cờ thành ảnh có mã băm đó)
+# các bàn cờ đối xứng với nhau có cùng mã băm chính tắc
+def canonical_hash(board):
+    rows, cols = len(board), len(board[0])
+    keys = get_zobrist_table(rows, cols).keys
+    stones = [(i, j, board[i][j]) for i in range(rows) for j in range(cols) if board[i][j] > 0]
+    best = None
+    for symmetry in get_symmetries(rows, cols):
+        h = 0
+        for i, j, mark in stones:
+            i_, j_ = transform_move((i, j), symmetry, rows, cols)
+            h ^= keys[mark][i_][j_]
+        if best is None or h < best[0]:
+            best = (h, symmetry)
+    return best
+
+
+# các mặt nạ bit tính sẵn cho một kích cỡ bàn cờ
+# mỗi hàng được lưu với thêm một cột đệm luôn bằng 0 để phép dịch bit không bị tràn sang hàng khác
+class BitMasks:
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.stride = cols + 1
+        # độ dịch bit tương ứng với 4 hướng trong DIRECTIONS
+        self.shifts = [1, self.stride + 1, self.stride, self.stride - 1]
+        self.board = 0  # mặt nạ tất cả các ô hợp lệ
+        self.row_masks = [0] * rows
+        self.col_masks = [0] * cols
+        self.diag_masks = [0] * (rows + cols - 1)  # đường chéo chính, chỉ số i - j + cols - 1
+        self.anti_diag_masks = [0] * (rows + cols - 1)  # đường chéo phụ, chỉ số i + j
+        for i in range(rows):
+            for j in range(cols):
+                bit = 1 << (i * self.stride + j)
+                self.board |= bit
+                self.row_masks[i] |= bit
+                self.col_masks[j] |= bit
+                self.diag_masks[i - j + cols - 1] |= bit
+                self.anti_diag_masks[i + j] |= bit
+
+    # trả về mặt nạ của 4 đường đi qua ô (i, j), theo thứ tự của DIRECTIONS
+    def lines_through(self, i, j):
+        return (self.row_masks[i], self.diag_masks[i - j + self.cols - 1],
+                self.col_masks[j], self.anti_diag_masks[i + j])
+
+
+_BIT_MASKS = {}
+
+
+# lấy bộ mặt nạ cho kích cỡ bàn cờ, mỗi kích cỡ chỉ tính một lần
+def get_bit_masks(rows, cols):
+    masks = _BIT_MASKS.get((rows, cols))
+    if masks is None:
+        masks = _BIT_MASKS[(rows, cols)] = BitMasks(rows, cols)
+    return masks
+
+
+# lớp biểu diễn bàn cờ bằng bit, mỗi người chơi là một số nguyên Python
+class BitBoard:
+    def __init__(self, rows, cols):
+        self.masks = get_bit_masks(rows, cols)
+        self.bits = [0, 0, 0]  # bits[1] là quân X, bits[2] là quân O
+        self.history = []  # các nước đã đánh, phục vụ undo
+
+    @staticmethod
+    def from_board(board):
+        bitboard = BitBoard(len(board), len(board[0]))
+        stride = bitboard.masks.stride
+        for i in range(len(board)):
+            row = board[i]
+            for j in range(len(row)):
+                if row[j] > 0:
+                    bitboard.bits[row[j]] |= 1 << (i * stride + j)
+        return bitboard
+
+    # chuyển về dạng mảng hai chiều như các engine đang dùng
+    def to_board(self):
+        return [[self.get(i, j) for j in range(self.masks.cols)] for i in range(self.masks.rows)]
+
+    def copy(self):
+        clone = BitBoard(self.masks.rows, self.masks.cols)
+        clone.bits = self.bits[:]
+        clone.history = self.history[:]
+        return clone
+
+    def bit(self, i, j):
+        return 1 << (i * self.masks.stride + j)
+
+    # trả về quân cờ tại ô (i, j): 0 nếu trống, 1 nếu là X, 2 nếu là O
+    def get(self, i, j):
+        bit = self.bit(i, j)
+        if self.bits[1] & bit:
+            return 1
+        if self.bits[2] & bit:
+            return 2
+        return 0
+
+    def place(self, i, j, player):
+        self.bits[player] |= self.bit(i, j)
+        self.history.append((i, j, player))
+
+    # hoàn tác nước đi cuối cùng và trả về nước đi đó
+    def undo(self):
+        i, j, player = self.history.pop()
+        self.bits[player] &= ~self.bit(i, j)
+        return i, j, player
+
+    def occupied_mask(self):
+        return self.bits[1] | self.bits[2]
+
+    def empty_mask(self):
+        return self.masks.board & ~(self.bits[1] | self.bits[2])
+
+    # mặt nạ các ô trống cách một quân cờ bất kỳ không quá radius ô (theo cả 8 hướng)
+    def neighbour_mask(self, radius=1):
+        occupied = self.occupied_mask()
+        area = occupied
+        for _ in range(radius):
+            grown = area
+            for shift in self.masks.shifts:
+                grown |= (area << shift) | (area >> shift)
+            area = grown & self.masks.board
+        return area & ~occupied
+
+    # kiểm tra người chơi có CONSECUTIVE_MARKS_TO_WIN quân liên tiếp trên toàn bàn cờ hay không
+    def has_five(self, player):
+        bits = self.bits[player]
+        for shift in self.masks.shifts:
+            if _has_run(bits, shift):
+                return True
+        return False
+
+    # kiểm tra chỉ trên 4 đường đi qua ô (i, j), dùng sau mỗi nước đi
+    def has_five_at(self, i, j, player):
+        bits = self.bits[player]
+        for shift, line in zip(self.masks.shifts, self.masks.lines_through(i, j)):
+            if _has_run(bits & line, shift):
+                return True
+        return False
+
+    # đếm số quân của người chơi trên một đường (mặt nạ lấy từ BitMasks)
+    def count_on_line(self, player, line_mask):
+        return bin(self.bits[player] & line_mask).count('1')
+
+    # liệt kê các ô (i, j) tương ứng với các bit bật trong mặt nạ
+    def cells(self, mask):
+        stride = self.masks.stride
+        result = []
+        while mask:
+            low = mask & -mask
+            index = low.bit_length() - 1
+            result.append((index // stride, index % stride))
+            mask ^= low
+        return result
+
+
+# kiểm tra có CONSECUTIVE_MARKS_TO_WIN bit liên tiếp theo độ dịch shift hay không
+def _has_run(bits, shift):
+    for _ in range(CONSECUTIVE_MARKS_TO_WIN - 1):
+        bits &= bits >> shift
+        if not bits:
+            return False
+    return True
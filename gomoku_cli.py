@@ -1,10 +1,11 @@
 import time
 import matplotlib.pyplot as plt
 
-from board_utils import check_board_status, IN_PROGRESS
+from board_utils import Position, IN_PROGRESS
 from gomoku_mcts import GomokuMCTS
 from gomoku_minimax import GomokuMinimax
 from gomoku_model import GomokuAI
+from position_cache import PositionCache
 
 X, O = 1, 2
 
@@ -26,30 +27,40 @@ def print_board(board):
 
 # Hàm để lấy input từ tác tử con người nếu cần
 def get_human_move():
-    move = map(int, input("Enter move in format of <row>,<col>: ").split(',', 1))
+    move = tuple(map(int, input("Enter move in format of <row>,<col>: ").split(',', 1)))
     return move
 
 
 # Hàm để chạy một ván đấu với kích cỡ bàn cờ và các người chơi cho trước
-def run_game(board_size=15, player_x=None, player_o=None, logging=True):
+# nếu có cache thì nước đi của các bot được tra cứu / lưu vào bộ nhớ đệm thế cờ
+def run_game(board_size=15, player_x=None, player_o=None, logging=True, cache=None):
     move_count = 0
     total_time = {
         X: 0,
         O: 0
     }
 
-    # khởi tạo bàn cờ, người chơi và lượt chơi
-    board = [[0 for j in range(board_size)] for i in range(board_size)]
+    # khởi tạo thế cờ, người chơi và lượt chơi
+    # thế cờ tự cập nhật số ô trống và trạng thái thắng thua sau mỗi nước đi
+    position = Position.empty(board_size)
+    board = position.board
     players = {
         X: player_x,
         O: player_o
     }
-    turn = X
 
     while True:
+        turn = position.turn
         if isinstance(players[turn], GomokuAI):
             start_time = time.perf_counter()
-            move = players[turn].calculate_move(board)
+            move = None
+            if cache is not None:
+                engine_key = (players[turn].name, getattr(players[turn], 'config', None), turn)
+                move = cache.get(board, engine_key)
+            if move is None:
+                move = players[turn].calculate_move(board)
+                if cache is not None:
+                    cache.put(board, engine_key, move)
             end_time = time.perf_counter()
             if logging:
                 print('Bot move:', move)
@@ -60,15 +71,14 @@ def run_game(board_size=15, player_x=None, player_o=None, logging=True):
             move = get_human_move()
             end_time = time.perf_counter()
             total_time[turn] += end_time - start_time
-        board[move[0]][move[1]] = turn
+        position.play(tuple(move[:2]))
         move_count += 1
         if logging:
             print_board(board)
 
-        status = check_board_status(board)
+        status = position.status
         if status != IN_PROGRESS:
             break
-        turn = 3 - turn
 
     print('Last state:')
     print_board(board)
@@ -83,7 +93,8 @@ def run_game(board_size=15, player_x=None, player_o=None, logging=True):
 
 # Hàm đánh giá với tham số là số ván đấu, kích cỡ bàn cờ và hai người chơi X, O
 # thực hiện một số
-def evaluate(num_games, board_size, player_x, player_o):
+# nếu có cache thì các thế cờ (kể cả các thế đối xứng) lặp lại giữa các ván không phải tính lại
+def evaluate(num_games, board_size, player_x, player_o, cache=None):
     move_counts = []
     x_avg_times = []
     o_avg_times = []
@@ -92,7 +103,8 @@ def evaluate(num_games, board_size, player_x, player_o):
     for i in range(num_games):
         print('-' * 60)
         print(f'Game {i + 1}/{num_games}')
-        status, move_count, x_avg_time, o_avg_time = run_game(board_size, player_x, player_o, logging=False)
+        status, move_count, x_avg_time, o_avg_time = run_game(board_size, player_x, player_o, logging=False,
+                                                              cache=cache)
         results[status] += 1
         move_counts.append(move_count)
         x_avg_times.append(x_avg_time)
@@ -103,6 +115,10 @@ def evaluate(num_games, board_size, player_x, player_o):
     print('X thắng:', results[X])
     print('O thắng:', results[O])
     print('Hòa:', results[0])
+    if cache is not None:
+        print('Bộ nhớ đệm:', cache.stats())
+        if cache.path is not None:
+            cache.save()
 
     plt.title('Số nước đi mỗi ván')
     plt.xlabel('Ván')
@@ -119,4 +135,5 @@ def evaluate(num_games, board_size, player_x, player_o):
 
 
 if __name__ == '__main__':
-    evaluate(num_games=10, board_size=10, player_x=GomokuMinimax(10, X, 2), player_o=GomokuMCTS(O, 1000))
+    evaluate(num_games=10, board_size=10, player_x=GomokuMinimax(10, X, 2), player_o=GomokuMCTS(O, 1000),
+             cache=PositionCache())
@@ -1,3 +1,4 @@
+import queue
 import sys
 
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QObject, QMutex, QSemaphore
@@ -5,10 +6,10 @@ from PyQt5.QtGui import QPainter, QColor, QPen, QFont, QIntValidator
 from PyQt5.QtWidgets import QApplication, QWidget, QHBoxLayout, QVBoxLayout, QPushButton, QLabel, QFormLayout, \
     QLineEdit, QComboBox, QSpinBox, QMessageBox
 
-from board_utils import check_board_status
+from board_utils import check_move_status, clone_board
 from gomoku_mcts import GomokuMCTS
 from gomoku_minimax import GomokuMinimax
-from gomoku_model import Human, GomokuAI
+from gomoku_model import Human, GomokuAI, CancelToken
 
 X, O = 1, 2
 symbols = {
@@ -21,26 +22,37 @@ DEFAULT_BOARD_SIZE = 12
 # semaphore = QSemaphore(1)
 
 
-class Worker(QObject):
-    # Define a signal to emit data or status
-    move_generated = pyqtSignal(tuple)
-    finished = pyqtSignal()
+# luồng chạy engine dùng chung cho cả ứng dụng, lần lượt xử lý các yêu cầu tính nước đi hoặc suy nghĩ trước
+# mỗi yêu cầu kèm một cờ hủy: yêu cầu đã bị hủy thì bỏ qua, kết quả được gửi về luồng giao diện kèm cờ hủy đó
+# để bàn cờ bỏ qua kết quả của các yêu cầu cũ (chẳng hạn của ván vừa được chơi lại)
+class EngineWorker(QObject):
+    move_generated = pyqtSignal(object, tuple)
 
-    def __init__(self, game_board):
+    def __init__(self):
         super().__init__()
-        self.game_board = game_board
+        self.requests = queue.Queue()
+
+    def submit(self, engine, board, cancel_token, ponder=False):
+        self.requests.put((engine, board, cancel_token, ponder))
+
+    # dừng vòng lặp sau khi xử lý xong các yêu cầu đang chờ
+    def stop(self):
+        self.requests.put(None)
 
     def run(self):
-        gb = self.game_board
-        while not gb.game_complete and isinstance(gb.players[gb.turn], GomokuAI):
-            move = gb.generate_bot_move()
-            # semaphore.acquire()
-            gb.board[move[0]][move[1]] = gb.turn
-            # semaphore.release()
-            self.move_generated.emit((move[0], move[1], gb.turn))
-            status = check_board_status(gb.board)
-            gb.toggle_turn()
-        self.finished.emit()
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            engine, board, cancel_token, ponder = request
+            if cancel_token.is_cancelled():
+                continue
+            if ponder:
+                engine.ponder(board, cancel_token)
+                continue
+            move = engine.calculate_move(board, cancel_token)
+            if move is not None and not cancel_token.is_cancelled():
+                self.move_generated.emit(cancel_token, (move[0], move[1]))
 
 
 class Mark(QWidget):
@@ -92,6 +104,7 @@ class GameBoard(QWidget):
         self.LINE_COLOR = QColor(0, 0, 0)
 
         self.board = [[0 for i in range(board_size)] for j in range(board_size)]
+        self.empty_count = board_size * board_size
         self.marks = [[None for i in range(board_size)] for j in range(board_size)]
         self.game_complete = False
         self.turn = X
@@ -103,8 +116,8 @@ class GameBoard(QWidget):
             self.players[X].name += '_1'
             self.players[O].name += '_2'
 
-        self.thread = None
-        self.worker = None
+        # cờ hủy của yêu cầu đang gửi cho engine (tính nước đi hoặc suy nghĩ trước)
+        self.cancel_token = None
 
     def paintEvent(self, event):
         painter = QPainter(self)
@@ -142,30 +155,48 @@ class GameBoard(QWidget):
         if self.board[i][j] > 0:
             return
 
+        # dừng suy nghĩ trước của bot (nếu có) ngay khi người chơi đánh
+        self.stop()
         self.board[i][j] = self.turn
         self.repaint()
-        self.toggle_turn()
-        if self.turn > 0 and isinstance(self.players[self.turn], GomokuAI):
-            self.handle_bot()
+        self.toggle_turn((i, j))
+        self.next_turn()
 
+    # gửi yêu cầu tính nước đi cho bot đang tới lượt
     def handle_bot(self):
-        self.thread = QThread()
-        self.worker = Worker(self)
-        self.worker.moveToThread(self.thread)
-        self.thread.started.connect(self.worker.run)
-        self.worker.finished.connect(self.thread.quit)
-        self.worker.move_generated.connect(self.handle_bot_move)
-        self.thread.start()
-
-    def generate_bot_move(self):
-        imax, jmax = len(self.board), len(self.board[0])
-        board = [[self.board[i][j] for j in range(jmax)] for i in range(imax)]
-        return self.players[self.turn].calculate_move(board)
-
-    def handle_bot_move(self, move):
-        # semaphore.acquire()
+        self.stop()
+        if self.game_complete or not isinstance(self.players[self.turn], GomokuAI):
+            return
+        self.cancel_token = CancelToken()
+        self.game.engine_worker.submit(self.players[self.turn], clone_board(self.board), self.cancel_token)
+
+    # nếu tới lượt bot thì tính nước đi, nếu tới lượt người chơi mà đối thủ là bot thì bot suy nghĩ trước
+    def next_turn(self):
+        if self.game_complete:
+            return
+        if isinstance(self.players[self.turn], GomokuAI):
+            self.handle_bot()
+        elif isinstance(self.players[3 - self.turn], GomokuAI):
+            self.stop()
+            self.cancel_token = CancelToken()
+            self.game.engine_worker.submit(self.players[3 - self.turn], clone_board(self.board), self.cancel_token,
+                                           ponder=True)
+
+    # nhận nước đi của bot, bỏ qua kết quả của các yêu cầu đã bị hủy hoặc không phải của bàn cờ này
+    def handle_bot_move(self, cancel_token, move):
+        if cancel_token is not self.cancel_token or self.game_complete:
+            return
+        self.cancel_token = None
+        self.board[move[0]][move[1]] = self.turn
         self.repaint()
-        # semaphore.release()
+        self.toggle_turn(move)
+        self.next_turn()
+
+    # hủy yêu cầu đang gửi cho engine (nếu có)
+    def stop(self):
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
+            self.cancel_token = None
 
     def draw_mark(self, i, j, mark_type):
         mark_width = int(0.8 * self.CELL_WIDTH)
@@ -180,8 +211,9 @@ class GameBoard(QWidget):
         mark.setGeometry(x + offset, y + offset, mark_width, mark_width)
         mark.show()
 
-    def toggle_turn(self):
-        status = check_board_status(self.board)
+    def toggle_turn(self, last_move):
+        self.empty_count -= 1
+        status = check_move_status(self.board, last_move, self.empty_count)
         if status >= 0:
             self.game_complete = True
             self.turn = 0
@@ -328,6 +360,13 @@ class Game(QWidget):
     def __init__(self):
         super().__init__()
         self.new_game_menu = None
+        # một luồng engine duy nhất cho cả ứng dụng, được giữ lại qua các ván
+        self.engine_thread = QThread()
+        self.engine_worker = EngineWorker()
+        self.engine_worker.moveToThread(self.engine_thread)
+        self.engine_thread.started.connect(self.engine_worker.run)
+        self.engine_worker.move_generated.connect(self.on_bot_move)
+        self.engine_thread.start()
         self.game_board = GameBoard(DEFAULT_BOARD_SIZE,
                                     GomokuMCTS(X, simulations_per_step=1200),
                                     GomokuMinimax(DEFAULT_BOARD_SIZE, O, max_depth=2), self)
@@ -408,6 +447,9 @@ class Game(QWidget):
         self.new_game_menu.show()
 
     def on_new_game_menu_submitted(self, data):
+        if self.game_board:
+            # hủy nước đi hoặc suy nghĩ trước đang chạy của ván cũ
+            self.game_board.stop()
         game_board = GameBoard(data['board_size'], data['player1'], data['player2'], self)
         if isinstance(game_board.players[X], GomokuAI):
             game_board.handle_bot()
@@ -425,7 +467,14 @@ class Game(QWidget):
             self.player_labels[player].setFont(QFont(FONT_FAMILY, 12))
             # self.player_labels[player].setStyleSheet(f"color: {'red' if player == X else 'blue'}")
 
+    def on_bot_move(self, cancel_token, move):
+        self.game_board.handle_bot_move(cancel_token, move)
+
     def quit(self):
+        self.game_board.stop()
+        self.engine_worker.stop()
+        self.engine_thread.quit()
+        self.engine_thread.wait()
         sys.exit(0)
 
 
@@ -1,14 +1,27 @@
 import math
 import random
 import time
+from array import array
+from concurrent.futures import wait
+from dataclasses import dataclass, replace
 
-from board_utils import get_empty_positions, clone_board, check_board_status, IN_PROGRESS, get_potential_moves, is_empty
-from gomoku_model import GomokuAI
+from board_utils import clone_board, IN_PROGRESS, is_empty, Position
+from gomoku_model import GomokuAI, CancelToken, POLL_INTERVAL
+from gomoku_rollout import RolloutEngine, BatchRolloutEngine
+from opening_book import DEFAULT_BOOK_PATH, get_opening_book
+from threat_search import ThreatSearch, THREAT_NODES
 
 INF = 2 ** 32 - 1
 WIN_SCORE = 10  # điểm thưởng cho mỗi giả lập thắng
-THINKING_TIME = 2000  # thời gian để tính toán một nước đi
-SIMULATION_COUNT = 1000
+SIMULATION_COUNT = 1000  # số lần giả lập mặc định cho mỗi nước đi
+TIME_CHECK_INTERVAL = 16  # số lần giả lập tối thiểu giữa hai lần kiểm tra đồng hồ
+PONDER_NODES = 100000  # số nút tối đa của cây khi suy nghĩ trước mặc định
+ROOT = 0  # chỉ số của nút gốc trong cây
+NO_NODE = -1  # chỉ số biểu thị không có nút
+# kết quả đã được chứng minh của một nút, tính theo người chơi di chuyển trước đó
+UNPROVEN = 0
+PROVEN_WIN = 1
+PROVEN_LOSS = -1
 
 
 # trả lại đối thủ của player (1-X, 2-O)
@@ -16,12 +29,11 @@ def opponent(player):
     return 3 - player
 
 
-# chỉ số heuristic tính lợi thế của một nước đi
-def heuristic(node):
-    board = node.board
-    opp = node.player
+# chỉ số heuristic tính lợi thế của nước đi move do người chơi player đánh
+def heuristic(board, move, player):
+    opp = player
     player = opponent(opp)
-    (i0, j0) = node.move
+    (i0, j0) = move
     directions = [[0, 1], [1, 1], [1, 0], [1, -1]]
     h = 0
 
@@ -65,80 +77,158 @@ def heuristic(node):
 
 
 # chỉ số UCB1 phản ánh độ ưu tiên khi khám phá một nút (lớn nếu nút đó có thống kê tốt hoặc chưa được thăm nhiều lần)
-def ucb1(node):
-    # print("1:", INF if node.visits == 0 else node.win_score / node.visits)
-    # print("2:", INF if node.visits == 0 else 2 * math.sqrt(math.log(node.parent.visits) / node.visits))
-    # print("3:", h)
-    res = INF if node.visits == 0 else node.win_score / node.visits + 2 * math.sqrt(
-        math.log(node.parent.visits) / node.visits)
-    # print("res:", res)
+# log_parent_visits là log số lần thăm của nút cha, được tính một lần cho tất cả các nút con
+def ucb1(tree, node, log_parent_visits):
+    visits = tree.visits[node]
+    res = INF if visits == 0 else tree.win_score[node] / visits + 2 * math.sqrt(log_parent_visits / visits)
     return res
 
 
 # chỉ số thống kê của một nút (giống như tỷ lệ thắng)
-def score(node):
-    if node.visits == 0:
+def score(tree, node):
+    if tree.visits[node] == 0:
         return -INF  # nếu chưa thăm thì không nên chọn
-    return node.win_score / node.visits
-
-
-# lớp đại diện cho một nút trạng thái trong cây tìm kiếm
-class State:
-    def __init__(self, board, player, move=None, parent=None):
-        self.parent = parent  # nút cha
-        self.children = []  # các nút con
-        self.player = player  # người chơi di chuyển trước đó
-        self.move = move  # nước đi dẫn tới trạng thái này
-        self.visits = 0  # số lần thăm
-        self.win_score = 0  # điểm tích lũy
-        self.board = board  # bàn cờ
-
-    # trả về một nút con ngẫu nhiên
-    def get_random_child(self):
-        if len(self.children) == 0:
-            return None
-        return random.choice(self.children)
-
-    # trả về nút con có thống kê tốt nhất
-    def get_best_child(self):
-        return max(self.children, key=score)
-
-    # trả về nút con có chỉ số UCB1 tốt nhất
-    def get_child_with_best_ucb(self):
-        return max(self.children, key=ucb1)
-
-    # đi một nước ngẫu nhiên để biến đổi thành trạng thái tiếp theo
-    def random_play(self):
-        self.player = opponent(self.player)
-        pos = random.choice(get_potential_moves(self.board))
-        self.board[pos[0]][pos[1]] = self.player
+    return tree.win_score[node] / tree.visits[node]
+
+
+# cây tìm kiếm lưu dưới dạng các mảng song song, mỗi nút là một chỉ số trong các mảng
+# các nút không lưu bàn cờ, bàn cờ của một nút được dựng lại bằng cách đánh các nước đi từ nút gốc xuống
+class SearchTree:
+    __slots__ = ('parent', 'move', 'player', 'status', 'visits', 'win_score', 'first_child', 'next_sibling',
+                 'child_count', 'proven', 'untried')
+
+    def __init__(self):
+        self.parent = array('i')  # nút cha
+        self.move = array('i')  # nước đi dẫn tới nút, mã hóa thành i * số cột + j
+        self.player = array('b')  # người chơi di chuyển trước đó
+        self.status = array('b')  # trạng thái bàn cờ sau nước đi
+        self.visits = array('i')  # số lần thăm
+        self.win_score = array('q')  # điểm tích lũy
+        self.first_child = array('i')  # nút con đầu tiên
+        self.next_sibling = array('i')  # nút anh em tiếp theo (các nút con tạo thành danh sách liên kết)
+        self.child_count = array('i')  # số nút con đã tạo
+        self.proven = array('b')  # kết quả đã chứng minh (UNPROVEN, PROVEN_WIN hoặc PROVEN_LOSS)
+        # các nước đi chưa được tạo nút con, sắp xếp tăng dần theo heuristic (nước tốt nhất ở cuối)
+        # chỉ có ở những nút đã được mở rộng ít nhất một lần
+        self.untried = {}
+
+    def __len__(self):
+        return len(self.parent)
+
+    # thêm một nút mới làm con của parent và trả về chỉ số của nút đó
+    def add_node(self, parent, move, player, status):
+        node = len(self.parent)
+        self.parent.append(parent)
+        self.move.append(move)
+        self.player.append(player)
+        self.status.append(status)
+        self.visits.append(0)
+        self.win_score.append(0)
+        self.first_child.append(NO_NODE)
+        self.child_count.append(0)
+        # nước đi tạo thành 5 quân liên tiếp thì người vừa đi chắc chắn thắng
+        self.proven.append(PROVEN_WIN if status == player else UNPROVEN)
+        if parent == NO_NODE:
+            self.next_sibling.append(NO_NODE)
+        else:
+            self.next_sibling.append(self.first_child[parent])
+            self.first_child[parent] = node
+            self.child_count[parent] += 1
+        return node
 
-    # tạo bản sao để phục vụ việc giả lập không ảnh hưởng đến nút ban đầu
-    def clone(self):
-        clone = State(self.board, self.player, self.move, self.parent)
-        clone.children = [child for child in self.children]
-        clone.visits = self.visits
-        clone.win_score = self.win_score
-        clone.board = clone_board(self.board)
-        return clone
+    def has_children(self, node):
+        return self.first_child[node] != NO_NODE
+
+    def children(self, node):
+        child = self.first_child[node]
+        result = []
+        while child != NO_NODE:
+            result.append(child)
+            child = self.next_sibling[child]
+        return result
+
+    # tạo cây mới chỉ gồm cây con có gốc tại node, giữ nguyên thống kê của các nút
+    def subtree(self, node):
+        tree = SearchTree()
+        mapping = {node: tree.add_node(NO_NODE, self.move[node], self.player[node], self.status[node])}
+        queue = [node]
+        for old in queue:
+            # duyệt ngược danh sách con để thứ tự các nút con được giữ nguyên sau khi thêm vào đầu danh sách
+            for child in reversed(self.children(old)):
+                mapping[child] = tree.add_node(mapping[old], self.move[child], self.player[child], self.status[child])
+                queue.append(child)
+        for old, new in mapping.items():
+            tree.visits[new] = self.visits[old]
+            tree.win_score[new] = self.win_score[old]
+            tree.proven[new] = self.proven[old]
+            if old in self.untried:
+                tree.untried[new] = self.untried[old]
+        return tree
+
+
+# cấu hình của một engine MCTS, không thay đổi được sau khi tạo
+# mỗi engine giữ cấu hình riêng nên nhiều engine khác cấu hình có thể chạy cùng lúc trong một tiến trình
+@dataclass(frozen=True)
+class MCTSConfig:
+    simulations_per_step: int = SIMULATION_COUNT  # số lần giả lập cho mỗi nước đi, None nếu chỉ giới hạn thời gian
+    frontier_radius: int = 1  # bán kính lấy nước đi quanh các ô đã đánh (1 hoặc 2)
+    # mở rộng dần: một nút được thăm n lần có tối đa ceil(widening_constant * (n + 1) ** widening_exponent) nút con
+    widening_constant: float = 2.0
+    widening_exponent: float = 0.5
+    # nếu có thì dừng khi hết thời gian này (mili giây), hoặc khi đủ simulations_per_step lần giả lập nếu xảy ra trước
+    time_budget_ms: int = None
+    # số tiến trình song song (1 là tìm kiếm tuần tự trong tiến trình hiện tại)
+    # nếu leaf_batch = 1 thì mỗi tiến trình xây một cây riêng (song song ở nút gốc),
+    # nếu không thì các tiến trình giả lập song song các nút lá của cùng một cây (song song ở nút lá)
+    workers: int = 1
+    rollout_policy: bool = False  # giả lập có ưu tiên thắng ngay / chặn thua ngay thay vì hoàn toàn ngẫu nhiên
+    rollout_depth: int = None  # số nước tối đa của một lần giả lập, None nếu đánh đến hết ván
+    batch_size: int = 1  # số ván giả lập cùng lúc từ mỗi nút lá bằng numpy (1 là giả lập từng ván)
+    leaf_batch: int = 1  # số nút lá được chọn trong một vòng lặp rồi giả lập cùng nhau
+    virtual_loss: int = 1  # số lần thua ảo cộng vào các nút trên đường đi đã chọn để các lần chọn sau đi đường khác
+    opening_book: str = DEFAULT_BOOK_PATH  # đường dẫn sách khai cuộc, None để không dùng
+    threat_nodes: int = THREAT_NODES  # số nút tối đa của tìm kiếm đe dọa trước khi tìm kiếm MCTS, 0 để tắt
+    use_vct: bool = False  # tìm kiếm đe dọa xét cả các nước 3 mở (VCT) chứ không chỉ các nước 4 (VCF)
+    # suy nghĩ trước dừng lại khi cây có từ chừng này nút trở lên, để cây (và lần chép cây con ở nước sau) không
+    # lớn mãi khi đối thủ nghĩ lâu, None nếu không giới hạn
+    ponder_nodes: int = PONDER_NODES
 
 
 # lớp đại diện cho thuật toán MCTS
 class GomokuMCTS(GomokuAI):
-    def __init__(self, player, simulations_per_step=1000):
+    mark_argument = 'player'
+
+    def __init__(self, player, simulations_per_step=SIMULATION_COUNT, frontier_radius=1, widening_constant=2.0,
+                 widening_exponent=0.5, time_budget_ms=None, workers=1, rollout_policy=False, rollout_depth=None,
+                 batch_size=1, leaf_batch=1, virtual_loss=1, opening_book=DEFAULT_BOOK_PATH,
+                 threat_nodes=THREAT_NODES, use_vct=False, ponder_nodes=PONDER_NODES):
         self.name = "MCTS"
-        self.root = None  # nút gốc
+        if simulations_per_step is None and time_budget_ms is None:
+            raise ValueError("MCTS needs a simulation limit or a time budget")
+        self.config = MCTSConfig(simulations_per_step, frontier_radius, widening_constant, widening_exponent,
+                                 time_budget_ms, workers, rollout_policy, rollout_depth, batch_size,
+                                 leaf_batch, virtual_loss, opening_book, threat_nodes, use_vct, ponder_nodes)
+        self.threat_search = ThreatSearch(threat_nodes, use_vct=use_vct) if threat_nodes > 0 else None
+        self.rollout = RolloutEngine(frontier_radius, rollout_policy, rollout_depth)
+        self.batch_rollout = None
+        if batch_size > 1:
+            self.batch_rollout = BatchRolloutEngine(batch_size, frontier_radius, rollout_depth)
+        self.tree = None  # cây tìm kiếm, nút gốc có chỉ số ROOT
+        self.position = None  # thế cờ làm việc, ứng với nút gốc của cây
+        self.cols = 0  # số cột của bàn cờ, dùng để mã hóa nước đi
         self.player = player  # người chơi mà AI nắm giữ (X hay O)
-        # global THINKING_TIME  # thời gian tính toán cố định cho mỗi nước đi
-        # THINKING_TIME = thinking_time
-        global SIMULATION_COUNT
-        SIMULATION_COUNT = simulations_per_step
+        self.seeds = random.Random()  # sinh hạt giống ngẫu nhiên cho các tiến trình con
+        self.cancel_token = None  # cờ hủy của lần tính nước đi / suy nghĩ trước hiện tại
 
         self.simulation_count = 0  # biến đếm số lần giả lập
 
     # nhận vào một bàn cờ và tính toán nước đi tiếp theo
-    def calculate_move(self, board):
+    # nếu có cancel_token thì tìm kiếm dừng lại khi cờ bị bật và kết quả là None (trừ các nước tìm được ngay không cần
+    # tìm kiếm như nước trong sách khai cuộc hay chuỗi thắng của tìm kiếm đe dọa)
+    def calculate_move(self, board, cancel_token=None):
         self.simulation_count = 0
+        # thời gian tìm kiếm đe dọa cũng được tính vào time_budget_ms
+        start_time = time.perf_counter()
 
         # nếu bàn cờ rỗng thì trả về một nước đi ngẫu nhiên
         if is_empty(board):
@@ -146,92 +236,377 @@ class GomokuMCTS(GomokuAI):
             padding = 1
             move = [random.randint(padding, len(board) - 1 - padding),
                     random.randint(padding, len(board[0]) - 1 - padding),
-                    0, 0]
+                    0, 0, 0]
             # print(self.player, ':', move)
             return move
 
-        # nếu chưa có nút gốc thì khởi tạo nút gốc
-        if self.root is None:
-            self.root = State(board, self.player)
-        # còn nếu đã có sẵn nút gốc
-        else:
-            # tìm xem bàn cờ đầu vào có phải một trong những nút con của nút gốc không
-            find_result = [b for b in self.root.children if b == board]
-            # nếu không thì tạo nút gốc mới
-            if len(find_result) == 0:
-                self.root = State(board, self.player)
-            # nếu có thì lấy luôn nút đó làm nút gốc mới
-            else:
-                self.root = find_result[0]
-                self.root.parent = None
-
-        # start_time = time.perf_counter()
-        # lặp lại quá trình tính toán cho đến khi hết thời gian chỉ định
-        # while int(round((time.perf_counter() - start_time) * 1000)) <= THINKING_TIME:
-        while self.simulation_count < SIMULATION_COUNT:
-            # chọn ra một nút lá tiềm năng để phát triển
-            selected_node = self.select()
-            if check_board_status(selected_node.board) == IN_PROGRESS:
-                # nếu chưa phải trạng thái cuối thì mở rộng nút đã chọn
-                self.expand(selected_node)
-            explored_node = selected_node
-            if len(selected_node.children) > 0:
-                # nếu nút đã chọn có con thì chọn một nút con ngẫu nhiên để khám phá
-                explored_node = selected_node.get_random_child()
+        # thế cờ có trong sách khai cuộc thì không cần tìm kiếm
+        if self.config.opening_book is not None:
+            book_move = get_opening_book(self.config.opening_book).lookup(board)
+            if book_move is not None:
+                return [*book_move, 0, 0, 0]
+
+        self.cancel_token = cancel_token
+        try:
+            # tìm chuỗi thắng bằng các nước đe dọa liên tiếp (4 hoặc 3 mở)
+            if self.threat_search is not None:
+                deadline = None
+                if self.config.time_budget_ms is not None:
+                    deadline = start_time + self.config.time_budget_ms / 1000
+                line = self.threat_search.search(clone_board(board), self.player, lambda: self.should_stop(deadline))
+                if line is not None:
+                    return [*line[0], WIN_SCORE, 0, 0]
+
+            if self.config.workers > 1 and self.config.leaf_batch == 1:
+                return self.calculate_move_parallel(board, start_time)
+
+            self.search(board, start_time=start_time)
+        finally:
+            self.cancel_token = None
+        if cancel_token is not None and cancel_token.is_cancelled():
+            # cây vẫn được giữ lại để dùng cho lần tính nước đi sau
+            return None
+        # sau khi hết thời gian, chọn ra nút con của nút gốc chắc chắn thắng,
+        # nếu không có thì chọn nút con có thống kê tốt nhất trong các nút con chưa chắc chắn thua
+        children = self.tree.children(ROOT)
+        best_child = next((child for child in children if self.tree.proven[child] == PROVEN_WIN), None)
+        if best_child is None:
+            children = [child for child in children if self.tree.proven[child] != PROVEN_LOSS] or children
+            best_child = max(children, key=lambda child: score(self.tree, child))
+        move = divmod(self.tree.move[best_child], self.cols)
+        elapsed = time.perf_counter() - start_time
+        # kết quả gồm nước đi, điểm, số lần giả lập và số lần giả lập mỗi giây
+        result = [*move, score(self.tree, best_child), self.simulation_count,
+                  self.simulation_count / elapsed if elapsed > 0 else 0]
+        # giữ lại cây con của nước đi đã chọn cho lượt sau
+        self.tree = self.tree.subtree(best_child)
+        self.position.play(move, self.player)
+        # print(self.player, ':', result)
+        return result
+
+    # song song hóa ở nút gốc: mỗi tiến trình con xây một cây độc lập từ cùng bàn cờ với hạt giống ngẫu nhiên riêng,
+    # số lần giả lập được chia đều cho các tiến trình, sau đó cộng dồn số lần thăm và điểm thắng của các nút con
+    # của nút gốc theo nước đi rồi chọn nước đi có thống kê tốt nhất
+    def calculate_move_parallel(self, board, start_time):
+        workers = self.config.workers
+        simulations = self.config.simulations_per_step
+        if simulations is not None:
+            simulations = -(-simulations // workers)
+        time_budget_ms = self.config.time_budget_ms
+        if time_budget_ms is not None:
+            # thời gian đã dùng trước khi gửi cho các tiến trình con (tìm kiếm đe dọa) được trừ vào thời gian chỉ định
+            time_budget_ms = max(1, int(time_budget_ms - (time.perf_counter() - start_time) * 1000))
+        config = replace(self.config, simulations_per_step=simulations, workers=1, time_budget_ms=time_budget_ms)
+        # cờ hủy của các tiến trình con được bật khi cờ hủy của lần tính nước đi này bị bật
+        shared_token = CancelToken(self.get_manager().Event()) if self.cancel_token is not None else None
+        futures = [self.get_pool().submit(search_root_stats, config, self.player, board, self.seeds.getrandbits(64),
+                                          shared_token)
+                   for _ in range(workers)]
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=POLL_INTERVAL)
+            if self.cancel_token is not None and self.cancel_token.is_cancelled():
+                shared_token.cancel()
+                return None
+        visits = {}
+        win_scores = {}
+        proven = {}
+        for future in futures:
+            stats, simulation_count = future.result()
+            self.simulation_count += simulation_count
+            for move, child_visits, win_score, child_proven in stats:
+                visits[move] = visits.get(move, 0) + child_visits
+                win_scores[move] = win_scores.get(move, 0) + win_score
+                if child_proven != UNPROVEN:
+                    proven[move] = child_proven
+
+        # nước đi được một tiến trình chứng minh là thắng thì chọn ngay, nước đi đã chứng minh là thua thì bỏ qua
+        moves = [move for move in visits if proven.get(move) == PROVEN_WIN] \
+            or [move for move in visits if proven.get(move) != PROVEN_LOSS] or list(visits)
+        best_move = max(moves, key=lambda move: win_scores[move] / visits[move] if visits[move] else -INF)
+        elapsed = time.perf_counter() - start_time
+        best_score = win_scores[best_move] / visits[best_move] if visits[best_move] else -INF
+        # cây của các tiến trình con không được giữ lại nên lượt sau sẽ tìm kiếm lại từ đầu
+        self.tree = None
+        return [*divmod(best_move, len(board[0])), best_score, self.simulation_count,
+                self.simulation_count / elapsed if elapsed > 0 else 0]
+
+    # suy nghĩ trước trong lượt của đối thủ (bàn cờ board, đối thủ đi tiếp theo) cho đến khi cancel_token bị bật:
+    # tiếp tục tìm kiếm trên cây hiện tại, nên các nước trả lời mà đối thủ nhiều khả năng chọn nhất được thăm nhiều nhất;
+    # khi đối thủ đánh một nước có trong cây thì lần tính nước đi sau bắt đầu từ cây con đã có thống kê của nước đó
+    # song song hóa ở nút gốc không giữ lại cây nên không suy nghĩ trước
+    def ponder(self, board, cancel_token):
+        if is_empty(board) or (self.config.workers > 1 and self.config.leaf_batch == 1):
+            return
+        self.cancel_token = cancel_token
+        try:
+            self.search(board, opponent(self.player), limited=False)
+        finally:
+            self.cancel_token = None
+
+    # hết thời gian (nếu có deadline) hoặc lần tìm kiếm hiện tại đã bị hủy
+    def should_stop(self, deadline):
+        if self.cancel_token is not None and self.cancel_token.is_cancelled():
+            return True
+        return deadline is not None and time.perf_counter() >= deadline
+
+    # tìm kiếm từ bàn cờ đầu vào, player là người đi tiếp theo (mặc định là AI)
+    # nếu limited thì dừng khi đủ số lần giả lập hoặc hết thời gian chỉ định (tính từ start_time hoặc từ lúc gọi hàm),
+    # nếu không thì dừng khi bị hủy hoặc khi cây đủ ponder_nodes nút
+    def search(self, board, player=None, limited=True, start_time=None):
+        if player is None:
+            player = self.player
+        # dùng lại cây tìm kiếm từ nước đi trước nếu bàn cờ đầu vào nằm trong cây, nếu không thì tạo nút gốc mới
+        # với người chơi di chuyển trước đó là đối thủ của người đi tiếp theo
+        root = self.find_root(board)
+        # thế cờ làm việc luôn ứng với nút gốc, được đánh thêm và hoàn tác các nước đi trong mỗi lần giả lập
+        self.position = Position(board, self.config.frontier_radius)
+        self.cols = len(board[0])
+        if root is None:
+            self.tree = SearchTree()
+            self.tree.add_node(NO_NODE, NO_NODE, opponent(player), self.position.status)
+        elif root != ROOT:
+            self.tree = self.tree.subtree(root)
+
+        # lặp lại quá trình tính toán cho đến khi đủ số lần giả lập, hết thời gian chỉ định hoặc bị hủy
+        # đồng hồ và cờ hủy được kiểm tra mỗi khi chạy thêm được TIME_CHECK_INTERVAL lần giả lập, nên khi giả lập theo
+        # lô (một vòng lặp gồm nhiều lần giả lập) thì được kiểm tra sau mỗi vòng lặp, số nút của cây cũng vậy
+        if start_time is None:
+            start_time = time.perf_counter()
+        max_simulations = self.config.simulations_per_step if limited else None
+        deadline = None
+        if limited and self.config.time_budget_ms is not None:
+            deadline = start_time + self.config.time_budget_ms / 1000
+        max_nodes = None if limited else self.config.ponder_nodes
+        next_check = self.simulation_count + TIME_CHECK_INTERVAL
+        # dừng sớm nếu kết quả của nút gốc đã được chứng minh
+        while (max_simulations is None or self.simulation_count < max_simulations) \
+                and self.tree.proven[ROOT] == UNPROVEN:
+            if self.simulation_count >= next_check:
+                next_check = self.simulation_count + TIME_CHECK_INTERVAL
+                if self.should_stop(deadline) or (max_nodes is not None and len(self.tree) >= max_nodes):
+                    break
+            if self.config.leaf_batch > 1:
+                self.search_leaf_batch()
+                continue
+            # chọn ra một nút lá tiềm năng để phát triển (có thể là nút con vừa được tạo)
+            path = self.select()
+            explored_node = path[-1]
             # giả lập một ván đấu hoàn thiện từ nút vừa chọn để lấy kết quả
-            status = self.simulate(explored_node)
+            results = self.simulate(explored_node)
             # cập nhật thống kê của các nút trên đường đi hiện tại dựa trên kết quả đó
-            self.back_propagation(explored_node, status)
+            self.back_propagation(explored_node, results)
+            # trả bàn cờ làm việc về trạng thái của nút gốc
+            for _ in path[1:]:
+                self.position.undo()
+
+    # một vòng lặp theo lô: chọn lần lượt leaf_batch nút lá, cộng thua ảo vào đường đi sau mỗi lần chọn để các lần
+    # chọn sau đi theo đường khác, giả lập các nút lá cùng nhau rồi bỏ thua ảo và cập nhật kết quả thật
+    def search_leaf_batch(self):
+        leaves = []
+        for _ in range(self.config.leaf_batch):
+            path = self.select()
+            node = path[-1]
+            # lưu lại bàn cờ, tập nước đi, người đi tiếp theo và số ô trống của nút lá để giả lập sau
+            if self.tree.status[node] == IN_PROGRESS and self.tree.proven[node] == UNPROVEN:
+                leaves.append((node, clone_board(self.position.board), list(self.position.frontier.moves),
+                               opponent(self.tree.player[node]), self.position.empty_count))
+            else:
+                leaves.append((node, None, None, None, None))
+            self.add_virtual_loss(node, self.config.virtual_loss)
+            for _ in path[1:]:
+                self.position.undo()
+        for (node, *_), results in zip(leaves, self.simulate_leaves(leaves)):
+            self.add_virtual_loss(node, -self.config.virtual_loss)
+            self.back_propagation(node, results)
+
+    # giả lập các nút lá đã chọn, bằng numpy nếu giả lập theo lô, bằng các tiến trình con nếu workers > 1,
+    # nếu không thì giả lập lần lượt; trả về số ván [hòa, X thắng, O thắng] của từng nút lá
+    def simulate_leaves(self, leaves):
+        pending = [leaf for leaf in leaves if leaf[1] is not None]
+        if self.batch_rollout is not None and pending:
+            results = self.batch_rollout.run_many([leaf[1] for leaf in pending], [leaf[3] for leaf in pending],
+                                                  [leaf[4] for leaf in pending])
+        else:
+            if self.config.workers > 1 and pending:
+                seeds = [self.seeds.getrandbits(64) for _ in pending]
+                statuses = self.get_pool().map(run_rollout, [self.config] * len(pending), *zip(*pending), seeds)
+            else:
+                statuses = [self.rollout.run(board, moves, player, empty_count)
+                            for _, board, moves, player, empty_count in pending]
+            results = [[int(status == k) for k in range(3)] for status in statuses]
+        pending_results = iter(results)
+        all_results = []
+        for leaf in leaves:
+            if leaf[1] is None:
+                # kết quả của nút lá đã biết
+                all_results.append(self.simulate(leaf[0]))
+            else:
+                all_results.append(next(pending_results))
+                self.simulation_count += sum(all_results[-1])
+        return all_results
+
+    # cộng (hoặc trừ nếu amount âm) số lần thăm ảo không có điểm thắng cho các nút từ node lên nút gốc
+    def add_virtual_loss(self, node, amount):
+        tree = self.tree
+        while node != NO_NODE:
+            tree.visits[node] += amount
+            node = tree.parent[node]
+
+    # tìm trong cây hiện tại nút có bàn cờ trùng với bàn cờ đầu vào
+    # so sánh với bàn cờ của nút gốc cũ để biết những nước đã được đánh thêm (thường là nước đi của đối thủ),
+    # rồi đi xuống các nút con, nút cháu tương ứng với các nước đó; trả về None nếu không tìm được
+    def find_root(self, board):
+        if self.tree is None or self.position is None or self.position.rows != len(board) \
+                or self.position.cols != len(board[0]):
+            return None
+        old_board = self.position.board
+        new_moves = {}
+        for i in range(len(board)):
+            for j in range(len(board[i])):
+                if old_board[i][j] != board[i][j]:
+                    # ô đã đánh ở nút gốc cũ bị thay đổi thì đây là một ván khác
+                    if old_board[i][j] != 0:
+                        return None
+                    new_moves[i * self.cols + j] = board[i][j]
+        node = ROOT
+        while new_moves:
+            next_player = opponent(self.tree.player[node])
+            node = next((child for child in self.tree.children(node)
+                         if new_moves.get(self.tree.move[child]) == next_player), None)
+            if node is None:
+                return None
+            del new_moves[self.tree.move[node]]
+        return node
 
-        # sau khi hết thời gian, chọn ra nút con của nút gốc có thống kê tốt nhất làm nước đi tiếp theo
-        best_child = self.root.get_best_child()
-        self.root = best_child
-        self.root.parent = None
-        # print(self.player, ':', [self.root.move[0], self.root.move[1], self.root.win_score / self.root.visits])
-        return [*self.root.move, score(self.root), self.simulation_count]
+    # đánh nước đi dẫn tới node lên thế cờ làm việc
+    def play(self, node):
+        self.position.play(divmod(self.tree.move[node], self.cols), self.tree.player[node])
 
-    # chọn ra một nút lá tiềm năng để phát triển
+    # chọn ra một nút lá tiềm năng để phát triển, trả về đường đi từ nút gốc tới nút đó
+    # tại mỗi nút, nếu số nút con còn ít so với số lần thăm thì tạo thêm một nút con và dừng ở đó,
+    # nếu không thì đi xuống nút con có chỉ số UCB1 tốt nhất trong các nút con chưa chắc chắn thua
+    # các nước đi trên đường đi được đánh lên bàn cờ làm việc
     def select(self):
-        node = self.root
-        while len(node.children) > 0:
-            node = node.get_child_with_best_ucb()
+        tree = self.tree
+        node = ROOT
+        path = [node]
+        while tree.status[node] == IN_PROGRESS and tree.proven[node] == UNPROVEN:
+            child = self.expand(node)
+            if child == NO_NODE:
+                children = [child for child in tree.children(node) if tree.proven[child] != PROVEN_LOSS]
+                if children:
+                    log_visits = math.log(max(tree.visits[node], 1))
+                    node = max(children, key=lambda child: ucb1(tree, child, log_visits))
+                    self.play(node)
+                    path.append(node)
+                    continue
+                # mọi nút con đã tạo đều chắc chắn thua thì mở rộng thêm bất kể giới hạn
+                child = self.expand(node, force=True)
+                if child == NO_NODE:
+                    break
+            self.play(child)
+            path.append(child)
+            break
         # print('select:', node)
-        return node
+        return path
+
+    # số nút con tối đa của một nút đã được thăm visits lần
+    def widening_limit(self, visits):
+        return math.ceil(self.config.widening_constant * (visits + 1) ** self.config.widening_exponent)
 
-    # sinh ra các nút con cho một nút lá
-    def expand(self, node):
+    # tạo thêm một nút con cho nút theo thứ tự heuristic, thế cờ làm việc đang ở trạng thái của nút đó
+    # trả về nút con mới, hoặc NO_NODE nếu chưa được phép mở rộng thêm (khi không có force) hay đã hết nước đi
+    def expand(self, node, force=False):
         # print('expand:', node)
-        for i, j in get_potential_moves(node.board):
-            child = State(clone_board(node.board), opponent(node.player))
-            child.board[i][j] = child.player
-            child.move = (i, j)
-            child.parent = node
-            node.children.append(child)
-
-    # giả lập một ván đấu hoàn chỉnh rồi trả về kết quả
+        tree = self.tree
+        player = opponent(tree.player[node])
+        untried = tree.untried.get(node)
+        if untried is None:
+            # lần đầu mở rộng: sắp xếp các nước đi theo lợi thế tấn công và phòng thủ
+            board = self.position.board
+            moves = sorted(self.position.frontier.moves, key=lambda move: heuristic(board, move, player)
+                           + heuristic(board, move, opponent(player)))
+            untried = tree.untried[node] = array('i', [i * self.cols + j for i, j in moves])
+        if not untried or (not force and tree.child_count[node] >= self.widening_limit(tree.visits[node])):
+            return NO_NODE
+        move = untried.pop()
+        self.position.play(divmod(move, self.cols), player)
+        status = self.position.status
+        self.position.undo()
+        child = tree.add_node(node, move, player, status)
+        self.update_proof(child)
+        return child
+
+    # lan truyền kết quả đã chứng minh của node lên các nút tổ tiên (MCTS-Solver)
+    # nút con thắng chắc thì nút cha thua chắc (người đi tiếp theo ở nút cha chọn nước đó),
+    # mọi nước đi của nút cha đều đã tạo và đều thua chắc thì nút cha thắng chắc
+    def update_proof(self, node):
+        tree = self.tree
+        while node != ROOT:
+            parent = tree.parent[node]
+            if tree.proven[node] == PROVEN_WIN:
+                tree.proven[parent] = PROVEN_LOSS
+            elif tree.proven[node] == PROVEN_LOSS and not tree.untried.get(parent) \
+                    and all(tree.proven[child] == PROVEN_LOSS for child in tree.children(parent)):
+                tree.proven[parent] = PROVEN_WIN
+            else:
+                return
+            node = parent
+
+    # giả lập từ nút (thế cờ làm việc đang ở trạng thái của nút đó) rồi trả về số ván [hòa, X thắng, O thắng]
+    # (một ván, hoặc batch_size ván nếu giả lập theo lô)
     def simulate(self, node):
-        self.simulation_count += 1
         # print('simulate:', node)
-        temp_state = node.clone()
-        # kiểm tra trạng thái hiện tại
-        status = check_board_status(temp_state.board)
-        # nếu đối thủ đã thắng thì phạt điểm âm vô cùng
-        if status == opponent(self.player):
-            temp_state.parent.win_score = -INF
-            return status
-
-        # đi từng nước ngẫu nhiên cho đến khi kết thúc
-        while status == IN_PROGRESS:
-            temp_state.random_play()
-            status = check_board_status(temp_state.board)
-        return status
+        # trạng thái hiện tại đã được tính sẵn khi tạo nút
+        status = self.tree.status[node]
+        results = [0, 0, 0]
+        proven = self.tree.proven[node]
+        if status != IN_PROGRESS:
+            results[status] = 1
+        elif proven != UNPROVEN:
+            # kết quả đã được chứng minh nên không cần giả lập
+            winner = self.tree.player[node] if proven == PROVEN_WIN else opponent(self.tree.player[node])
+            results[winner] = 1
+        elif self.batch_rollout is not None:
+            results = self.batch_rollout.run(self.position.board, opponent(self.tree.player[node]),
+                                             self.position.empty_count)
+        else:
+            # đi từng nước cho đến khi kết thúc, bàn cờ làm việc được trả lại sau khi giả lập
+            status = self.rollout.run(self.position.board, self.position.frontier.moves,
+                                      opponent(self.tree.player[node]), self.position.empty_count)
+            results[status] = 1
+        self.simulation_count += sum(results)
+        return results
 
     # cập nhật thống kê cho các nút trên nhánh hiện tại dựa trên kết quả giả lập
-    def back_propagation(self, node, status):
+    def back_propagation(self, node, results):
+        tree = self.tree
+        visits = sum(results)
         temp = node
-        while temp is not None:
-            temp.visits += 1
-            if status == temp.player:
-                temp.win_score += WIN_SCORE
+        while temp != NO_NODE:
+            tree.visits[temp] += visits
+            tree.win_score[temp] += WIN_SCORE * results[tree.player[temp]]
             # print('back-propagate:', temp)
-            temp = temp.parent
+            temp = tree.parent[temp]
+
+
+# hàm chạy trong tiến trình con: tìm kiếm tuần tự từ bàn cờ đầu vào rồi trả về thống kê
+# (nước đi, số lần thăm, điểm thắng, kết quả đã chứng minh) của các nút con của nút gốc cùng số lần giả lập đã chạy
+# tìm kiếm dừng sớm khi cancel_token (cờ hủy dùng chung giữa các tiến trình) bị bật
+def search_root_stats(config, player, board, seed, cancel_token=None):
+    random.seed(seed)
+    engine = GomokuMCTS.from_config(config, player)
+    engine.cancel_token = cancel_token
+    engine.search(board)
+    tree = engine.tree
+    stats = [(tree.move[child], tree.visits[child], tree.win_score[child], tree.proven[child])
+             for child in tree.children(ROOT)]
+    return stats, engine.simulation_count
+
+
+# hàm chạy trong tiến trình con: giả lập một ván từ bàn cờ của một nút lá rồi trả về kết quả
+def run_rollout(config, leaf_node, board, moves, player, empty_count, seed):
+    random.seed(seed)
+    rollout = RolloutEngine(config.frontier_radius, config.rollout_policy, config.rollout_depth)
+    return rollout.run(board, moves, player, empty_count)
@@ -1,371 +1,759 @@
 from IPython.display import clear_output
-import random, copy
+import random, copy, time
+from concurrent.futures import wait, FIRST_COMPLETED
+from dataclasses import dataclass, replace
+from itertools import islice
+
+from board_utils import is_empty, get_potential_moves, get_zobrist_table, Position, count_consecutive, makes_five, \
+    DIRECTIONS, IN_PROGRESS
+from gomoku_model import GomokuAI, CancelToken, POLL_INTERVAL
+from opening_book import DEFAULT_BOOK_PATH, get_opening_book
+from threat_search import ThreatSearch, THREAT_NODES
+
+DEEP_MAX = 2  # độ sâu tìm kiếm mặc định
+WINNING_SCORE = 10 ** 10  # điểm thắng cuộc
 
-from board_utils import is_empty
-from gomoku_model import GomokuAI
+# điểm của tìm kiếm negamax là số nguyên, theo góc nhìn của bên đi tiếp theo
+# điểm đánh giá tĩnh được giới hạn trong [-MAX_EVAL, MAX_EVAL], thắng chắc sau k nước có điểm MATE_SCORE - k,
+# SCORE_INF lớn hơn mọi điểm và chỉ dùng làm cận của cửa sổ tìm kiếm
+MAX_EVAL = 10 ** 13
+MATE_SCORE = 10 ** 14
+MATE_BOUND = MATE_SCORE - 1000  # điểm lớn hơn giá trị này là điểm thắng chắc
+SCORE_INF = 10 ** 15
+ASPIRATION_WINDOW = 200  # nửa độ rộng cửa sổ quanh điểm của lần tìm kiếm sâu dần trước
 
-DEEP_MAX = 2  # độ sâu tìm kiếm
-WINNING_SCORE = 10 ** 10  # điểm thắng cuộc
-SIZE = 15
+LINE_CHUNK = 4  # số ô trong một khóa tra bảng
+BORDER = 3  # giá trị đệm ở cuối mỗi đường, được coi như quân đối phương với cả hai bên
+_LINES = {}  # các đường của bàn cờ đã tính sẵn cho từng kích cỡ
 
+TT_SIZE = 2 ** 18  # số ô của bảng chuyển vị
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2  # loại giá trị lưu trong bảng chuyển vị
+TIME_CHECK_INTERVAL = 256  # số nút duyệt giữa hai lần kiểm tra đồng hồ
 
-class GomokuMinimax(GomokuAI):
-    def __init__(self, board_size, bot_mark, max_depth=2):
-        self.bot_mark = bot_mark
-        self.name = 'MINIMAX'
-        global SIZE
-        SIZE = board_size
-        global DEEP_MAX
-        DEEP_MAX = max_depth
-        # print('init minimax player of', ['', 'X', 'O'][bot_mark])
 
-    # hàm này sẽ trả về một list là các nước đi cạnh những ô đã được đánh rồi
-    # chẳng hạn như nếu bàn cờ hiện tại chỉ mới có 1 nước được đánh ở giữa bàn cờ
-    # thì hàm sẽ trả về list có 8 phần tử là các ô xung quanh
-    def generate_move(self, board) -> list:
-        possible_moves = []
-        # duyệt cả bàn cờ
-        for row in range(SIZE):
-            for col in range(SIZE):
-                # nếu ô hiện tại đã đánh rồi, bỏ qua
-                if board[row][col] > 0:
-                    continue
-                # ngược lại nếu chưa được đánh, ta sẽ kiểm tra các vị trí xung
-                # quanh ô này đã được đánh chưa, nếu có thì thêm vào possible_moves
-                if row > 0:
-                    if col > 0:
-                        if board[row - 1][col - 1] > 0 or board[row][col - 1] > 0:
-                            possible_moves.append((row, col))
-                    if col < SIZE - 1:
-                        if board[row - 1][col + 1] > 0 or board[row][col + 1] > 0:
-                            possible_moves.append((row, col))
-                    if board[row - 1][col] > 0:
-                        possible_moves.append((row, col))
-                if row < SIZE - 1:
-                    if col > 0:
-                        if board[row + 1][col - 1] > 0 or board[row][col - 1] > 0:
-                            possible_moves.append((row, col))
-                    if col < SIZE - 1:
-                        if board[row + 1][col + 1] > 0 or board[row][col + 1] > 0:
-                            possible_moves.append((row, col))
-                    if board[row + 1][col] > 0:
-                        possible_moves.append((row, col))
-        return possible_moves
-
-    # hàm lấy điểm dựa vào vị trí thế cờ
-    def get_score(self, consecutive, blocked_side, is_turn) -> int:
-        # bị chặn cả 2 bên mà dưới 5 ô liên tiếp thì là nước cờ chết 
-        if blocked_side == 2 and consecutive < 5:
-            return 0
-        if blocked_side < 0:
-            return 0
-        if consecutive <= 0:
-            return 0
-
-            # 5 ô liên tiếp là thắng
-        if consecutive == 5:
-            return WINNING_SCORE
-
-            # 4 ô liên tiếp
-        if consecutive == 4:
-            # hiện tại là lượt đánh của máy -> thắng 
+# ngoại lệ dùng để dừng tìm kiếm khi hết thời gian hoặc bị hủy
+class SearchTimeout(Exception):
+    pass
+
+
+# hàm lấy điểm dựa vào vị trí thế cờ
+def get_score(consecutive, blocked_side, is_turn) -> int:
+    # bị chặn cả 2 bên mà dưới 5 ô liên tiếp thì là nước cờ chết 
+    if blocked_side == 2 and consecutive < 5:
+        return 0
+    if blocked_side < 0:
+        return 0
+    if consecutive <= 0:
+        return 0
+
+        # 5 ô liên tiếp là thắng
+    if consecutive == 5:
+        return WINNING_SCORE
+
+        # 4 ô liên tiếp
+    if consecutive == 4:
+        # hiện tại là lượt đánh của máy -> thắng 
+        if is_turn:
+            return WINNING_SCORE / 10
+            # lượt sau thắng do cả 2 bên không bị chặn
+        elif blocked_side == 0:
+            return WINNING_SCORE / 100
+            # ép đối phương chặn lượt tiếp theo
+        else:
+            return 200
+
+            # 3 ô liên tiếp
+    elif consecutive == 3:
+        # không bên nào bị chặn 
+        if blocked_side == 0:
             if is_turn:
-                return WINNING_SCORE / 10
-                # lượt sau thắng do cả 2 bên không bị chặn
-            elif blocked_side == 0:
-                return WINNING_SCORE / 100
+                return WINNING_SCORE / 1000
                 # ép đối phương chặn lượt tiếp theo
             else:
                 return 200
-
-                # 3 ô liên tiếp
-        elif consecutive == 3:
-            # không bên nào bị chặn 
-            if blocked_side == 0:
-                if is_turn:
-                    return WINNING_SCORE / 1000
-                    # ép đối phương chặn lượt tiếp theo
-                else:
-                    return 200
-                    # bị chặn 1 bên
+                # bị chặn 1 bên
+        else:
+            if is_turn:
+                return 10
             else:
-                if is_turn:
-                    return 10
-                else:
-                    return 5
+                return 5
 
-                    # 2 ô liên tiếp
-        elif consecutive == 2:
-            if blocked_side == 0:
-                if is_turn:
-                    return 7
-                else:
-                    return 5
+                # 2 ô liên tiếp
+    elif consecutive == 2:
+        if blocked_side == 0:
+            if is_turn:
+                return 7
             else:
-                return 3
-
-                # 1 ô liên tiếp
-        elif consecutive == 1:
-            return 1
-
-            # trường hợp 5 ô liên tiếp trờ lên
+                return 5
         else:
-            return WINNING_SCORE * 10
-
-    # hàm này đánh giá vị trí hiện tại của bàn cờ, phục vụ cho các hàm đánh giá hàng, cột, đường chéo phía dưới
-    # eval = [consecutive, blocked_side, score] (số ô cờ liên tiếp, số bên bị chặn, điểm số)
-    def evaluate_position(self, board, x, y, is_bot, is_bot_turn, eval, prepos) -> int:
-        # lấy giá trị để so sánh
-        val = 0
-        if is_bot:
-            val = self.bot_mark
+            return 3
+
+            # 1 ô liên tiếp
+    elif consecutive == 1:
+        return 1
+
+        # trường hợp 5 ô liên tiếp trờ lên
+    else:
+        return WINNING_SCORE * 10
+
+
+# một bước của máy trạng thái đánh giá đường: xét ô có giá trị cell với quân cần đánh giá val
+# state = (consecutive, blocked_side, gap_consecutive, gap_blocked_side): số ô liên tiếp, số bên bị chặn,
+# và đoạn liên tiếp đứng trước một ô trống (để ghép với đoạn tiếp theo thành thế cờ có khoảng trống)
+# trả về trạng thái mới cùng điểm cộng thêm khi là lượt của bên đó và khi không phải lượt
+def _step(state, cell, val):
+    consecutive, blocked_side, gap_consecutive, gap_blocked_side = state
+    turn_score = not_turn_score = 0
+    # nếu cùng là người chơi hoặc máy đánh, tăng số ô liên tiếp thêm 1
+    # số ô liên tiếp chỉ cần lưu tới 6 vì mọi đoạn từ 6 ô trở lên được tính điểm như nhau
+    if cell == val:
+        return (min(consecutive + 1, 6), blocked_side, gap_consecutive, gap_blocked_side), 0, 0
+    # nếu ô hiện tại trống
+    if cell == 0:
+        if consecutive == 0:
+            # ô trước đó trống, hoặc là quân đối phương (khi đó gap_consecutive = 0 nên không được điểm)
+            turn_score = get_score(gap_consecutive, gap_blocked_side - 1, True)
+            not_turn_score = get_score(gap_consecutive, gap_blocked_side - 1, False)
+        elif gap_consecutive > 0:
+            turn_score = get_score(min(consecutive + gap_consecutive, 4), gap_blocked_side - 1, True)
+            not_turn_score = get_score(min(consecutive + gap_consecutive, 4), gap_blocked_side - 1, False)
+            gap_consecutive, gap_blocked_side = 0, 0
         else:
-            val = 3 - self.bot_mark
-
-        # nếu cùng là người chơi hoặc máy đánh, tăng số ô liên tiếp thêm 1
-        if board[x][y] == val:
-            eval[0] += 1
-
-        # nếu ô hiện tại trống
-        elif board[x][y] == 0:
-            if prepos == 0:
-                eval[2] += self.get_score(eval[3], eval[4] - 1, is_bot == is_bot_turn)
-            elif prepos == val:
-                if eval[3] > 0:
-                    eval[2] += self.get_score(min(eval[0] + eval[3], 4), eval[4] - 1, is_bot == is_bot_turn)
-                    eval[3] = 0
-                else:
-                    eval[3] = eval[0]
-                    eval[4] = eval[1]
-
-            # đặt lại là bên phải bị chặn
-            eval[0] = 0
-            eval[1] = 1
+            gap_consecutive, gap_blocked_side = consecutive, blocked_side
+        # đặt lại là bên phải bị chặn
+        return (0, 1, gap_consecutive, gap_blocked_side), turn_score, not_turn_score
+    # ô hiện tại là ô cờ của đối phương hoặc đã hết đường
+    if gap_consecutive > 0:
+        turn_score = get_score(min(consecutive + gap_consecutive, 4), gap_blocked_side, True)
+        not_turn_score = get_score(min(consecutive + gap_consecutive, 4), gap_blocked_side, False)
+    else:
+        turn_score = get_score(consecutive, blocked_side, True)
+        not_turn_score = get_score(consecutive, blocked_side, False)
+    return (0, 2, 0, 0), turn_score, not_turn_score
+
+
+# hàm tính sẵn bảng điểm cho mỗi quân val: với mỗi trạng thái và mỗi khóa gồm LINE_CHUNK ô
+# (mã hóa cơ số 4, ô đầu tiên là chữ số thấp nhất), lưu lại trạng thái tiếp theo và điểm cộng thêm
+def _build_score_table(val):
+    # bảng chuyển trạng thái theo từng ô, chỉ gồm các trạng thái đi tới được từ đầu đường
+    initial = (0, 2, 0, 0)
+    state_ids = {initial: 0}
+    states = [initial]
+    steps = []
+    for state in states:
+        row = []
+        for cell in range(4):
+            next_state, turn_score, not_turn_score = _step(state, cell, val)
+            if next_state not in state_ids:
+                state_ids[next_state] = len(states)
+                states.append(next_state)
+            row.append((state_ids[next_state], not_turn_score, turn_score))
+        steps.append(row)
+    # ghép LINE_CHUNK bước liên tiếp thành một lần tra bảng
+    table = []
+    for state_id in range(len(states)):
+        row = []
+        for key in range(4 ** LINE_CHUNK):
+            next_id, not_turn_score, turn_score = state_id, 0, 0
+            for pos in range(LINE_CHUNK):
+                next_id, not_turn_delta, turn_delta = steps[next_id][key >> 2 * pos & 3]
+                not_turn_score += not_turn_delta
+                turn_score += turn_delta
+            row.append((next_id, not_turn_score, turn_score))
+        table.append(row)
+    return table
+
+
+SCORE_TABLES = [None, _build_score_table(1), _build_score_table(2)]
+
+
+# hàm liệt kê các đường được đánh giá (hàng, cột, hai họ đường chéo)
+# thứ tự duyệt và cách đánh chỉ số giống với cách đánh giá theo từng hàng, cột, đường chéo trước đây
+# cell_lines[x][y] chứa các bộ (chỉ số đường, chỉ số khóa, trọng số của ô trong khóa) đi qua ô (x, y)
+def get_lines(size):
+    if size in _LINES:
+        return _LINES[size]
+    lines = []
+    for row in range(size):
+        lines.append([(row, col) for col in range(size)])
+    for col in range(size):
+        lines.append([(row, col) for row in range(size)])
+    for i in range(2 * size - 1):
+        lines.append([(j, (j - i) % size) for j in range(max(0, i - size + 1), min(size - 1, i) + 1)])
+    for i in range(1 - size, size):
+        lines.append([(j, (i - j) % size) for j in range(max(0, i), min(size + i - 1, size - 1) + 1)])
+    cell_lines = [[[] for _ in range(size)] for _ in range(size)]
+    for line_id, line in enumerate(lines):
+        for pos, (x, y) in enumerate(line):
+            cell_lines[x][y].append((line_id, pos // LINE_CHUNK, 4 ** (pos % LINE_CHUNK)))
+    _LINES[size] = (lines, cell_lines)
+    return _LINES[size]
+
+
+# hàm mã hóa một đường thành các khóa tra bảng, phần cuối được đệm BORDER (luôn có ít nhất một ô đệm)
+def get_line_keys(board, line):
+    cells = [board[x][y] for (x, y) in line]
+    cells += [BORDER] * (LINE_CHUNK - len(cells) % LINE_CHUNK)
+    return [sum(cells[i + pos] * 4 ** pos for pos in range(LINE_CHUNK)) for i in range(0, len(cells), LINE_CHUNK)]
+
+
+# hàm tính điểm của một đường đã mã hóa cho quân val, trả về [điểm khi không phải lượt, điểm khi là lượt]
+def score_line_keys(keys, val):
+    table = SCORE_TABLES[val]
+    state = 0
+    not_turn_score = turn_score = 0
+    for key in keys:
+        state, not_turn_delta, turn_delta = table[state][key]
+        not_turn_score += not_turn_delta
+        turn_score += turn_delta
+    return [not_turn_score, turn_score]
+
+
+# bộ đánh giá tăng dần: lưu khóa và điểm của từng đường, sau mỗi nước đánh thử chỉ tính lại 4 đường đi qua ô đó
+# điểm được lưu cho cả 4 trường hợp (máy/người chơi, có/không phải lượt của bên đó) để lấy ra trong O(1)
+class IncrementalEvaluator:
+    def __init__(self, engine, board):
+        self.bot_mark = engine.bot_mark
+        self.lines, self.cell_lines = get_lines(len(board))
+        self.line_keys = [get_line_keys(board, line) for line in self.lines]
+        # line_scores[id][k] với k = 2 * is_bot + is_turn
+        self.line_scores = [self.score_line(keys) for keys in self.line_keys]
+        self.totals = [sum(scores[k] for scores in self.line_scores) for k in range(4)]
+        self.history = []  # thay đổi của các đường, phục vụ undo
+
+    def score_line(self, keys):
+        return score_line_keys(keys, 3 - self.bot_mark) + score_line_keys(keys, self.bot_mark)
+
+    # cập nhật sau khi ô (x, y) vừa được đánh
+    def place(self, board, x, y):
+        mark = board[x][y]
+        changed = []
+        for line_id, chunk, weight in self.cell_lines[x][y]:
+            keys = self.line_keys[line_id]
+            keys[chunk] += mark * weight
+            old_scores = self.line_scores[line_id]
+            new_scores = self.score_line(keys)
+            for k in range(4):
+                self.totals[k] += new_scores[k] - old_scores[k]
+            self.line_scores[line_id] = new_scores
+            changed.append((line_id, chunk, mark * weight, old_scores))
+        self.history.append(changed)
+
+    # khôi phục khóa và điểm các đường trước nước đánh cuối cùng, không cần tính lại
+    def undo(self):
+        for line_id, chunk, delta, old_scores in self.history.pop():
+            self.line_keys[line_id][chunk] -= delta
+            new_scores = self.line_scores[line_id]
+            for k in range(4):
+                self.totals[k] += old_scores[k] - new_scores[k]
+            self.line_scores[line_id] = old_scores
+
+    def get_board_score(self, is_bot, is_bot_turn):
+        return self.totals[2 * is_bot + (is_bot == is_bot_turn)]
+
+
+# điểm thắng chắc được lưu trong bảng chuyển vị theo khoảng cách tới thế cờ được lưu chứ không tới nút gốc,
+# để dùng lại đúng khi cùng thế cờ xuất hiện ở độ sâu khác
+def score_to_tt(value, deep):
+    if value > MATE_BOUND:
+        return value + deep
+    if value < -MATE_BOUND:
+        return value - deep
+    return value
+
+
+def score_from_tt(value, deep):
+    if value > MATE_BOUND:
+        return value - deep
+    if value < -MATE_BOUND:
+        return value + deep
+    return value
+
+
+# khóa so sánh bàn cờ, dùng để nhận ra thế cờ đã được suy nghĩ trước
+def board_key(board):
+    return tuple(map(tuple, board))
+
+
+# bảng chuyển vị kích thước cố định, đánh chỉ số theo mã băm Zobrist của thế cờ
+# mỗi ô lưu (mã băm, độ sâu còn lại, loại giá trị, giá trị, nước đi tốt nhất, lượt tìm kiếm)
+class TranspositionTable:
+    def __init__(self, size=TT_SIZE):
+        self.size = size
+        self.slots = [None] * size
+        self.generation = 0  # tăng lên mỗi lần tính nước đi mới
+
+    def new_search(self):
+        self.generation += 1
+
+    def get(self, key):
+        entry = self.slots[key % self.size]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    # thay thế theo độ sâu: chỉ ghi đè ô trống, ô của lần tìm kiếm trước hoặc ô có độ sâu không lớn hơn
+    def store(self, key, depth, flag, value, move):
+        slot = key % self.size
+        entry = self.slots[slot]
+        if entry is None or entry[5] != self.generation or depth >= entry[1]:
+            self.slots[slot] = (key, depth, flag, value, move, self.generation)
+
+
+# cấu hình của một engine minimax, không thay đổi được sau khi tạo
+# mỗi engine giữ cấu hình riêng nên nhiều engine khác cấu hình có thể chạy cùng lúc trong một tiến trình
+@dataclass(frozen=True)
+class MinimaxConfig:
+    board_size: int
+    max_depth: int = DEEP_MAX  # độ sâu tìm kiếm khi không giới hạn thời gian
+    frontier_radius: int = 1  # bán kính lấy nước đi quanh các ô đã đánh (1 hoặc 2)
+    tt_size: int = TT_SIZE  # số ô của bảng chuyển vị, 0 để tắt
+    time_budget_ms: int = None  # nếu có thì tìm kiếm sâu dần trong khoảng thời gian này (mili giây)
+    max_moves: int = None  # nếu có thì mỗi nút chỉ xét max_moves nước đi tốt nhất sau khi sắp xếp
+    opening_book: str = DEFAULT_BOOK_PATH  # đường dẫn sách khai cuộc, None để không dùng
+    threat_nodes: int = THREAT_NODES  # số nút tối đa của tìm kiếm đe dọa trước khi tìm kiếm minimax, 0 để tắt
+    use_vct: bool = False  # tìm kiếm đe dọa xét cả các nước 3 mở (VCT) chứ không chỉ các nước 4 (VCF)
+    workers: int = 1  # số tiến trình chia nhau tìm kiếm các nước đi ở nút gốc (1 là tìm kiếm tuần tự)
+    # khi tìm kiếm song song, mọi nước đi ở nút gốc dùng cùng một cận alpha để kết quả không phụ thuộc thứ tự
+    # các tiến trình chạy xong (tốn nhiều nút hơn vì cận không được cập nhật trong lúc tìm kiếm)
+    deterministic: bool = False
 
-        # ô hiện tại là ô cờ của đối phương
-        else:
-            if eval[3] > 0:
-                eval[2] += self.get_score(min(eval[0] + eval[3], 4), eval[4], is_bot == is_bot_turn)
-            else:
-                eval[2] += self.get_score(eval[0], eval[1], is_bot == is_bot_turn)
-
-            eval[0] = 0
-            eval[1] = 2
-            eval[3] = 0
-
-    # hàm đánh giá điểm dựa theo thế cờ các hàng
-    # eval = [consecutive, blocked_side, score] (số ô cờ liên tiếp, số bên bị chặn, điểm số) 
-    def evaluate_row(self, board, is_bot, is_bot_turn) -> int:
-        eval = [0, 2, 0, 0, 0]
-        for row in range(SIZE):
-            prepos = 0
-            for col in range(SIZE):
-                self.evaluate_position(board, row, col, is_bot, is_bot_turn, eval, prepos)
-                prepos = board[row][col]
-                # sau khi kết thúc một hàng, cần xem là có thể đánh giá được nốt không (trường hợp đầu tiên của hàm evaluate_position)
-            if eval[3] > 0:
-                eval[2] += self.get_score(min(eval[0] + eval[3], 4), eval[4], is_bot == is_bot_turn)
-            elif eval[0] > 0:
-                eval[2] += self.get_score(eval[0], eval[1], is_bot == is_bot_turn)
-            eval[0] = 0
-            eval[1] = 2
-            eval[3] = 0
-        return eval[2]
-
-    # hàm đánh giá điểm dựa theo thế cờ các cột 
-    # eval = [consecutive, blocked_side, score] (số ô cờ liên tiếp, số bên bị chặn, điểm số) 
-    def evaluate_col(self, board, is_bot, is_bot_turn) -> int:
-        eval = [0, 2, 0, 0, 0]
-        for col in range(SIZE):
-            prepos = 0
-            for row in range(SIZE):
-                self.evaluate_position(board, row, col, is_bot, is_bot_turn, eval, prepos)
-                prepos = board[row][col]
-                # sau khi kết thúc một cột, cần xem là có thể đánh giá được nốt không (trường hợp đầu tiên của hàm evaluate_position)
-            if eval[3] > 0:
-                eval[2] += self.get_score(min(eval[0] + eval[3], 4), eval[4], is_bot == is_bot_turn)
-            elif eval[0] > 0:
-                eval[2] += self.get_score(eval[0], eval[1], is_bot == is_bot_turn)
-            eval[0] = 0
-            eval[1] = 2
-            eval[3] = 0
-        return eval[2]
-
-    # hàm đánh giá điểm dựa theo thế cờ các đường chéo 
-    # eval = [consecutive, blocked_side, score] (số ô cờ liên tiếp, số bên bị chặn, điểm số) 
-    def evaluate_diagonal(self, board, is_bot, is_bot_turn) -> int:
-        eval = [0, 2, 0, 0, 0]
-        for i in range(2 * SIZE - 1):
-            start = max(0, i - SIZE + 1)
-            end = min(SIZE - 1, i)
-            prepos = 0
-            for j in range(start, end + 1):
-                self.evaluate_position(board, j, j - i, is_bot, is_bot_turn, eval, prepos)
-                prepos = board[j][j - i]
-
-                # sau khi kết thúc một đường chéo, cần xem là có thể đánh giá được nốt không (trường hợp đầu tiên của hàm evaluate_position)
-            if eval[3] > 0:
-                eval[2] += self.get_score(min(eval[0] + eval[3], 4), eval[4], is_bot == is_bot_turn)
-            elif eval[0] > 0:
-                eval[2] += self.get_score(eval[0], eval[1], is_bot == is_bot_turn)
-            eval[0] = 0
-            eval[1] = 2
-            eval[3] = 0
-
-        for i in range(1 - SIZE, SIZE):
-            start = max(0, i)
-            end = min(SIZE + i - 1, SIZE - 1)
-            prepos = 0
-            for j in range(start, end + 1):
-                self.evaluate_position(board, j, i - j, is_bot, is_bot_turn, eval, prepos)
-                prepos = board[j][i - j]
-
-                # sau khi kết thúc một đường chéo, cần xem là có thể đánh giá được nốt không (trường hợp đầu tiên của hàm evaluate_position)
-            if eval[3] > 0:
-                eval[2] += self.get_score(min(eval[0] + eval[3], 4), eval[4], is_bot == is_bot_turn)
-            elif eval[0] > 0:
-                eval[2] += self.get_score(eval[0], eval[1], is_bot == is_bot_turn)
-            eval[0] = 0
-            eval[1] = 2
-            eval[3] = 0
-
-        return eval[2]
 
-    # hàm trả về điểm số của bàn cờ dựa theo thế cờ các hàng, cột, đường chéo
-    def get_board_score(self, board, is_bot, is_bot_turn) -> int:
-        return self.evaluate_row(board, is_bot, is_bot_turn) + self.evaluate_col(board, is_bot,
-                                                                                 is_bot_turn) + self.evaluate_diagonal(
-            board, is_bot, is_bot_turn)
-
-    # hảm trả về điểm số của máy so với người chơi 
-    # trả về list để đồng bộ dữ liệu với hàm minimax 
-    def get_relative_score(self, board, is_bot_turn) -> list:
-        o_score = self.get_board_score(board, True, is_bot_turn)
-        x_score = self.get_board_score(board, False, is_bot_turn)
-        if x_score == 0:
-            x_score = 1
-        return [0, 0, o_score / x_score]
-
-    # hàm này tìm xem có nước nào đánh thắng game không, phục vụ cho việc tìm nước đi của máy tốt hơn 
-    def search_winning_move(self, board, is_bot) -> tuple:
-        moves = self.generate_move(board)
-        val = 0
-        if is_bot:
-            val = self.bot_mark
-        else:
-            val = 3 - self.bot_mark
-        for (x, y) in moves:
-            board[x][y] = val
-            score = self.get_board_score(board, is_bot, is_bot)
-            board[x][y] = 0
-            if score >= WINNING_SCORE:
-                temp = self.get_relative_score(board, is_bot)
-                temp[0] = x
-                temp[1] = y
-                return temp
-        return 0
+class GomokuMinimax(GomokuAI):
+    mark_argument = 'bot_mark'
 
-    # hàm tìm kiếm minimax kết hợp cắt tỉa alpha-beta 
-    def minimax(self, board, deep, is_bot, alpha, beta):
-        # đã đủ độ sâu, trả về điểm tương quan bàn cờ hiện tại 
-        if deep == DEEP_MAX:
-            score = self.get_relative_score(board, is_bot)
-            return score
+    def __init__(self, board_size, bot_mark, max_depth=DEEP_MAX, frontier_radius=1, tt_size=TT_SIZE,
+                 time_budget_ms=None, max_moves=None, opening_book=DEFAULT_BOOK_PATH, threat_nodes=THREAT_NODES,
+                 use_vct=False, workers=1, deterministic=False):
+        self.config = MinimaxConfig(board_size, max_depth, frontier_radius, tt_size, time_budget_ms, max_moves,
+                                    opening_book, threat_nodes, use_vct, workers, deterministic)
+        self.bot_mark = bot_mark
+        self.killers = []  # killers[deep]: tối đa 2 nước đi gây cắt tỉa gần nhất ở độ sâu deep
+        # history[mark][x][y]: điểm lịch sử của nước đi, tăng lên mỗi khi nước đi đó gây cắt tỉa hoặc là nước tốt nhất
+        self.history = [None] + [[[0] * board_size for _ in range(board_size)] for _ in (1, 2)]
+        self.depth_limit = max_depth  # độ sâu của lần tìm kiếm hiện tại
+        self.deadline = None  # thời điểm phải dừng tìm kiếm (theo time.perf_counter)
+        self.cancel_token = None  # cờ hủy của lần tính nước đi / suy nghĩ trước hiện tại
+        self.pondered = None  # (bàn cờ, kết quả) của lần suy nghĩ trước gần nhất đã tìm kiếm đủ độ sâu
+        self.best_root_move = None  # nước đi tốt nhất của lần tìm kiếm sâu dần trước đó
+        self.nodes = 0  # số nút đã duyệt
+        # mã băm Zobrist và bảng chuyển vị, gắn với quân của máy và kích cỡ bàn cờ
+        self.zobrist = get_zobrist_table(board_size, board_size)
+        self.tt = TranspositionTable(tt_size) if tt_size > 0 else None
+        # thế cờ đang tìm kiếm kèm bộ đánh giá tăng dần, chỉ tồn tại trong lúc tính nước đi
+        self.position = None
+        self.threat_search = ThreatSearch(threat_nodes, use_vct=use_vct) if threat_nodes > 0 else None
+        self.name = 'MINIMAX'
+        # print('init minimax player of', ['', 'X', 'O'][bot_mark])
 
-        best_move = self.search_winning_move(board, is_bot)
-        if best_move != 0:
-            return best_move
+    # hàm này sẽ trả về một list là các nước đi cạnh những ô đã được đánh rồi
+    # chẳng hạn như nếu bàn cờ hiện tại chỉ mới có 1 nước được đánh ở giữa bàn cờ
+    # thì hàm sẽ trả về list có 8 phần tử là các ô xung quanh
+    # trong lúc tìm kiếm, danh sách này lấy từ tập nước đi của self.position được cập nhật dần sau mỗi nước đi
+    def generate_move(self, board) -> list:
+        if self.position is None:
+            return get_potential_moves(board, self.config.frontier_radius)
+        return self.position.frontier.sorted_moves()
 
-            # lấy các nước đi hợp lệ
-        possible_moves = self.generate_move(board)
+    # hàm đánh giá điểm của một đường theo bảng tra tính sẵn
+    def evaluate_line(self, board, line, is_bot, is_bot_turn) -> int:
+        val = self.bot_mark if is_bot else 3 - self.bot_mark
+        scores = score_line_keys(get_line_keys(board, line), val)
+        return scores[is_bot == is_bot_turn]
 
-        # trường hợp không còn nước đi nào thì chỉ cần trả về điểm là được 
+    # hàm trả về điểm số của bàn cờ dựa theo thế cờ các hàng, cột, đường chéo
+    # trong lúc tìm kiếm, điểm số được lấy ngay từ bộ đánh giá tăng dần
+    def get_board_score(self, board, is_bot, is_bot_turn) -> int:
+        if self.position is not None:
+            return self.position.evaluator.get_board_score(is_bot, is_bot_turn)
+        lines, _ = get_lines(len(board))
+        return sum(self.evaluate_line(board, line, is_bot, is_bot_turn) for line in lines)
+
+    # điểm của thế cờ theo góc nhìn của bên đi tiếp theo (máy nếu is_bot_turn):
+    # điểm của bên đó trừ điểm của đối phương, giới hạn trong [-MAX_EVAL, MAX_EVAL]
+    def evaluate(self, board, is_bot_turn) -> int:
+        own = self.get_board_score(board, is_bot_turn, is_bot_turn)
+        other = self.get_board_score(board, not is_bot_turn, is_bot_turn)
+        return max(-MAX_EVAL, min(MAX_EVAL, int(own - other)))
+
+    # hàm này tìm xem có nước nào đánh thắng game không, phục vụ cho việc tìm nước đi của máy tốt hơn
+    # trả về nước đi (x, y) hoặc None
+    def search_winning_move(self, board, is_bot):
+        val = self.bot_mark if is_bot else 3 - self.bot_mark
+        for move in self.generate_move(board):
+            if self.position.is_winning_move(move, val):
+                return move
+        return None
+
+    # hàm tìm kiếm negamax với cửa sổ chính (PVS): nước đi đầu tiên được tìm kiếm với cửa sổ (alpha, beta),
+    # các nước còn lại với cửa sổ rỗng (alpha, alpha + 1) để chứng minh không tốt hơn,
+    # chỉ tìm kiếm lại với cửa sổ đầy đủ khi chứng minh thất bại
+    # trả về [x, y, điểm] với điểm theo góc nhìn của bên đi tiếp theo (máy nếu is_bot)
+    def negamax(self, board, deep, is_bot, alpha, beta):
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_INTERVAL == 0 and self.should_stop():
+            raise SearchTimeout()
+
+        # đã đủ độ sâu, trả về điểm đánh giá bàn cờ hiện tại
+        if deep == self.depth_limit:
+            return [0, 0, self.evaluate(board, is_bot)]
+
+        # tra bảng chuyển vị, thế cờ đã được tìm kiếm đủ sâu thì dùng lại kết quả (trừ nút gốc)
+        key = self.position.hash ^ self.zobrist.turn_key if is_bot else self.position.hash
+        remaining = self.depth_limit - deep
+        entry = self.tt.get(key) if self.tt is not None else None
+        hash_move = entry[4] if entry is not None else None
+        if entry is not None and deep > 0 and entry[1] >= remaining:
+            flag, value, move = entry[2], score_from_tt(entry[3], deep), entry[4]
+            if flag == EXACT or (flag == LOWER_BOUND and value >= beta) or (flag == UPPER_BOUND and value <= alpha):
+                return [move[0], move[1], value]
+        alpha_orig = alpha
+
+        # thắng được ngay thì không cần tìm kiếm tiếp
+        win = self.search_winning_move(board, is_bot)
+        if win is not None:
+            return [win[0], win[1], MATE_SCORE - deep - 1]
+
+        # lấy các nước đi hợp lệ và sắp xếp để các nước tốt được xét trước, giúp cắt tỉa sớm hơn
+        # ở nút gốc, nước đi tốt nhất của lần tìm kiếm sâu dần trước đó được xét đầu tiên
+        if deep == 0 and self.best_root_move is not None:
+            hash_move = self.best_root_move
+        mark = self.bot_mark if is_bot else 3 - self.bot_mark
+        possible_moves = self.order_moves(board, self.generate_move(board), deep, mark, hash_move)
+
+        # trường hợp không còn nước đi nào thì chỉ cần trả về điểm là được
         if len(possible_moves) == 0:
-            score = self.get_relative_score(board, is_bot)
-            return score
-
-            # bắt đầu quá trình tìm kiếm minimax, khởi tạo nước đi tốt nhất
-        best_move = [0, 0, 0]
-        # tìm kiếm max - máy 
-        if is_bot:
-            # khởi tạo điểm số âm vô cùng 
-            best_move[2] = -1
-            for (x, y) in possible_moves:
-                board[x][y] = self.bot_mark
-                temp_move = self.minimax(board, deep + 1, False, alpha, beta)
-                board[x][y] = 0
-
-                # đổi giá trị alpha 
-                if temp_move[2] > alpha:
-                    alpha = temp_move[2]
-
-                    # cắt tỉa
-                if temp_move[2] >= beta:
-                    return temp_move
-
-                if temp_move[2] > best_move[2]:
-                    best_move[0] = x
-                    best_move[1] = y
-                    best_move[2] = temp_move[2]
-                    # tìm kiếm min - người chơi
-        else:
-            # khởi tạo điểm số dương vô cùng 
-            best_move[2] = 10 ** 10
-            for (x, y) in possible_moves:
-                board[x][y] = 3 - self.bot_mark
-                temp_move = self.minimax(board, deep + 1, True, alpha, beta)
-                board[x][y] = 0
-
-                # đổi giá trị beta 
-                if temp_move[2] < beta:
-                    beta = temp_move[2]
-
-                    # cắt tỉa
-                if temp_move[2] <= alpha:
-                    return temp_move
-
-                if temp_move[2] < best_move[2]:
-                    best_move[0] = x
-                    best_move[1] = y
-                    best_move[2] = temp_move[2]
+            return [0, 0, self.evaluate(board, is_bot)]
 
+        best_move = [possible_moves[0][0], possible_moves[0][1], -SCORE_INF]
+        for index, (x, y) in enumerate(possible_moves):
+            self.position.play((x, y), mark)
+            if index == 0:
+                score = -self.negamax(board, deep + 1, not is_bot, -beta, -alpha)[2]
+            else:
+                score = -self.negamax(board, deep + 1, not is_bot, -alpha - 1, -alpha)[2]
+                if alpha < score < beta:
+                    score = -self.negamax(board, deep + 1, not is_bot, -beta, -score)[2]
+            self.position.undo()
+
+            if score > best_move[2]:
+                best_move = [x, y, score]
+            if score > alpha:
+                alpha = score
+            # cắt tỉa
+            if alpha >= beta:
+                self.store_tt(key, remaining, deep, alpha_orig, beta, score, (x, y))
+                self.record_cutoff(deep, remaining, mark, x, y)
+                return best_move
+
+        self.store_tt(key, remaining, deep, alpha_orig, beta, best_move[2], (best_move[0], best_move[1]))
+        self.history[mark][best_move[0]][best_move[1]] += remaining * remaining
         return best_move
 
+    # sắp xếp nước đi theo thứ tự: nước đi trong bảng chuyển vị, nước thắng ngay, nước chặn đối phương thắng,
+    # các nước killer ở độ sâu này, rồi theo điểm lịch sử và cuối cùng là điểm đe dọa tĩnh
+    def order_moves(self, board, moves, deep, mark, hash_move):
+        killers = self.killers[deep] if deep < len(self.killers) else ()
+        history = self.history[mark]
+        keys = {}
+        for (x, y) in moves:
+            if (x, y) == hash_move:
+                priority = 5
+            elif makes_five(board, x, y, mark):
+                priority = 4
+            elif makes_five(board, x, y, 3 - mark):
+                priority = 3
+            elif (x, y) in killers:
+                priority = 2
+            else:
+                priority = 0
+            keys[(x, y)] = (priority, history[x][y], self.static_move_score(board, x, y, mark))
+        moves = sorted(moves, key=keys.__getitem__, reverse=True)
+        if self.config.max_moves is not None:
+            moves = moves[:self.config.max_moves]
+        return moves
+
+    # điểm đe dọa tĩnh của nước đi: tổng bình phương số quân liên tiếp của cả hai bên nối với ô (x, y)
+    def static_move_score(self, board, x, y, mark):
+        score = 0
+        for d in DIRECTIONS:
+            for player in (mark, 3 - mark):
+                length = count_consecutive(board, x, y, d, player) \
+                         + count_consecutive(board, x, y, (-d[0], -d[1]), player)
+                score += length * length
+        return score
+
+    # ghi nhận nước đi gây cắt tỉa cho killer và history
+    def record_cutoff(self, deep, remaining, mark, x, y):
+        while len(self.killers) <= deep:
+            self.killers.append([])
+        killers = self.killers[deep]
+        if (x, y) not in killers:
+            killers.insert(0, (x, y))
+            del killers[2:]
+        self.history[mark][x][y] += remaining * remaining
+
+    # lưu kết quả của một nút ở độ sâu deep vào bảng chuyển vị, loại giá trị xác định theo cửa sổ (alpha, beta) ban đầu
+    def store_tt(self, key, depth, deep, alpha, beta, value, move):
+        if self.tt is None:
+            return
+        if value <= alpha:
+            flag = UPPER_BOUND
+        elif value >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.tt.store(key, depth, flag, score_to_tt(value, deep), move)
+
+    # chuẩn bị tìm kiếm: tạo tập nước đi, bộ đánh giá, mã băm cho bàn cờ và làm mới các bảng heuristic
+    # tìm kiếm trên bản sao vì khi hết giờ, bàn cờ đang tìm kiếm sẽ không được hoàn tác, bản sao được trả về
+    def prepare(self, board):
+        self.position = Position(board, self.config.frontier_radius)
+        self.position.evaluator = IncrementalEvaluator(self, self.position.board)
+        if (self.zobrist.rows, self.zobrist.cols) != (len(board), len(board[0])):
+            # kích cỡ bàn cờ thay đổi thì không dùng lại được bảng chuyển vị cũ
+            self.zobrist = get_zobrist_table(len(board), len(board[0]))
+            self.tt = TranspositionTable(self.tt.size) if self.tt is not None else None
+        if self.tt is not None:
+            self.tt.new_search()
+        self.nodes = 0
+        self.deadline = None
+        self.best_root_move = None
+        self.killers = []
+        if len(self.history[1]) != len(board):
+            self.history = [None] + [[[0] * len(board[0]) for _ in range(len(board))] for _ in (1, 2)]
+        else:
+            # giảm dần ảnh hưởng của điểm lịch sử từ các nước đi trước
+            for mark in (1, 2):
+                for row in self.history[mark]:
+                    for j in range(len(row)):
+                        row[j] >>= 1
+        return self.position.board
+
     # hàm tính nước đi cho máy 
-    def calculate_move(self, board):
+    # kết quả gồm [hàng, cột, điểm, độ sâu đã tìm kiếm xong, số nút đã duyệt]
+    # nếu có cancel_token thì tìm kiếm dừng lại khi cờ bị bật và kết quả là None (trừ các nước tìm được ngay không cần
+    # tìm kiếm như nước trong sách khai cuộc hay chuỗi thắng của tìm kiếm đe dọa)
+    def calculate_move(self, board, cancel_token=None):
+        # thời gian tìm kiếm đe dọa cũng được tính vào time_budget_ms
+        start_time = time.perf_counter()
         # nếu bàn cờ rỗng thì trả về nước ngẫu nhiên
         if is_empty(board):
             padding = 1
             move = [random.randint(padding, len(board) - 1 - padding),
                     random.randint(padding, len(board[0]) - 1 - padding),
-                    0]
+                    0, 0, 0]
             # print(self.bot_mark, ':', move)
             return move
 
-        # trước tiên tìm nước đi mà có thể thắng được luôn 
-        move = self.search_winning_move(board, True)
-        # nếu có thì trả về
-        if move != 0:
-            # print(self.bot_mark, ':', move)
-            return move
-        # nếu không thì thực hiện tìm kiếm minimax
-        else:
-            move = self.minimax(board, 0, True, -1, WINNING_SCORE)
-            if move != 0:
+        # thế cờ có trong sách khai cuộc thì không cần tìm kiếm
+        if self.config.opening_book is not None:
+            book_move = get_opening_book(self.config.opening_book).lookup(board)
+            if book_move is not None:
+                return [*book_move, 0, 0, 0]
+
+        pondered, self.pondered = self.pondered, None
+        board = self.prepare(board)
+        self.cancel_token = cancel_token
+        try:
+            # trước tiên tìm nước đi mà có thể thắng được luôn 
+            move = self.search_winning_move(board, True)
+            # nếu có thì trả về
+            if move is not None:
                 # print(self.bot_mark, ':', move)
+                return [*move, MATE_SCORE - 1, 1, self.nodes]
+            # tìm chuỗi thắng bằng các nước đe dọa liên tiếp (4 hoặc 3 mở)
+            if self.threat_search is not None:
+                if self.config.time_budget_ms is not None:
+                    self.deadline = start_time + self.config.time_budget_ms / 1000
+                line = self.threat_search.search(board, self.bot_mark, self.should_stop)
+                self.deadline = None
+                if line is not None:
+                    return [*line[0], MATE_SCORE - len(line), len(line), self.nodes + self.threat_search.nodes]
+                if cancel_token is not None and cancel_token.is_cancelled():
+                    return None
+            # đối thủ đã đánh đúng nước được đoán khi suy nghĩ trước thì dùng lại kết quả
+            if pondered is not None and pondered[0] == board_key(board):
+                return pondered[1]
+            # nếu không thì thực hiện tìm kiếm minimax
+            if self.config.time_budget_ms is None:
+                self.depth_limit = self.config.max_depth
+                try:
+                    move = self.search_root(board)
+                except SearchTimeout:
+                    return None
+                return move[:3] + [self.config.max_depth, self.nodes]
+            return self.iterative_deepening(board, self.config.time_budget_ms, start_time=start_time)
+        finally:
+            self.position = None
+            self.deadline = None
+            self.cancel_token = None
+
+    # suy nghĩ trước trong lượt của đối thủ (bàn cờ board, đối thủ đi tiếp theo) cho đến khi cancel_token bị bật:
+    # đoán nước đi của đối thủ là nước tốt nhất đã lưu trong bảng chuyển vị từ lần tìm kiếm trước (nếu không có thì là
+    # nước đầu tiên theo thứ tự sắp xếp), rồi tìm kiếm sâu dần thế cờ sau nước đó
+    # bảng chuyển vị được giữ lại nên nếu đối thủ đánh đúng nước đã đoán thì lần tính nước đi sau không phải tìm kiếm lại
+    # các độ sâu đã xong; với độ sâu cố định thì kết quả được dùng lại luôn
+    def ponder(self, board, cancel_token):
+        self.pondered = None
+        if is_empty(board):
+            return
+        board = self.prepare(board)
+        self.cancel_token = cancel_token
+        try:
+            moves = self.generate_move(board)
+            if not moves or self.position.status != IN_PROGRESS:
+                return
+            entry = self.tt.get(self.position.hash) if self.tt is not None else None
+            reply = self.order_moves(board, moves, 0, 3 - self.bot_mark, entry[4] if entry is not None else None)[0]
+            self.position.play(reply, 3 - self.bot_mark)
+            if self.position.status != IN_PROGRESS:
+                return
+            if self.config.time_budget_ms is None:
+                result = self.iterative_deepening(board, None, self.config.max_depth)
+                if result is not None and result[3] == self.config.max_depth:
+                    self.pondered = (board_key(board), result)
+            else:
+                self.iterative_deepening(board, None)
+        finally:
+            self.position = None
+            self.deadline = None
+            self.cancel_token = None
+
+    # hết thời gian hoặc lần tìm kiếm hiện tại đã bị hủy
+    def should_stop(self):
+        if self.cancel_token is not None and self.cancel_token.is_cancelled():
+            return True
+        return self.deadline is not None and time.perf_counter() > self.deadline
+
+    # tìm kiếm sâu dần với độ sâu 1, 2, 3, ... cho đến khi hết thời gian budget_ms (nếu có, tính từ start_time hoặc từ
+    # lúc gọi hàm), đến độ sâu max_depth
+    # (nếu có) hoặc bị hủy; trả về nước đi của lần tìm kiếm hoàn chỉnh sâu nhất (None nếu bị hủy trước khi xong độ sâu
+    # đầu tiên), nước đi đó được xét đầu tiên ở lần tìm kiếm sau
+    def iterative_deepening(self, board, budget_ms, max_depth=None, start_time=None):
+        if start_time is None:
+            start_time = time.perf_counter()
+        budget = budget_ms / 1000 if budget_ms is not None else None
+        best_move = None
+        depth = 1
+        limit = self.position.empty_count if max_depth is None else min(max_depth, self.position.empty_count)
+        # độ sâu đầu tiên luôn được tìm kiếm xong để chắc chắn có nước đi (trừ khi bị hủy)
+        while depth <= limit:
+            self.depth_limit = depth
+            try:
+                move = self.aspiration_search(board, best_move[2] if best_move is not None else None)
+            except SearchTimeout:
+                break
+            best_move = move[:3] + [depth, self.nodes]
+            self.best_root_move = (move[0], move[1])
+            if budget is not None:
+                elapsed = time.perf_counter() - start_time
+                # lần tìm kiếm sau tốn nhiều thời gian hơn tổng các lần trước, nên không bắt đầu nếu đã dùng quá nửa
+                # thời gian
+                if elapsed * 2 > budget:
+                    break
+                self.deadline = start_time + budget
+            depth += 1
+        if best_move is not None:
+            best_move[4] = self.nodes
+        return best_move
+
+    # tìm kiếm với cửa sổ hẹp quanh điểm previous của lần tìm kiếm sâu dần trước, điểm nằm ngoài cửa sổ thì
+    # mở rộng phía bị vượt ra vô cùng rồi tìm kiếm lại (bảng chuyển vị giúp lần tìm kiếm lại nhanh hơn)
+    # tìm kiếm song song ở nút gốc và điểm thắng chắc luôn dùng cửa sổ đầy đủ
+    def aspiration_search(self, board, previous):
+        if previous is None or self.config.workers > 1 or abs(previous) > MATE_BOUND:
+            return self.search_root(board)
+        alpha, beta = previous - ASPIRATION_WINDOW, previous + ASPIRATION_WINDOW
+        while True:
+            move = self.search_root(board, alpha, beta)
+            if move[2] <= alpha:
+                alpha = -SCORE_INF
+            elif move[2] >= beta:
+                beta = SCORE_INF
+            else:
                 return move
-        return 0
+
+    # tìm kiếm từ nút gốc tới độ sâu depth_limit, tuần tự hoặc chia cho các tiến trình con nếu workers > 1
+    def search_root(self, board, alpha=-SCORE_INF, beta=SCORE_INF):
+        if self.config.workers > 1:
+            return self.root_split(board)
+        return self.negamax(board, 0, True, alpha, beta)
+
+    # tìm kiếm song song ở nút gốc: nước đi đầu tiên theo thứ tự sắp xếp được tìm kiếm tuần tự để có cận alpha,
+    # các nước còn lại được chia cho các tiến trình con, mỗi tiến trình tìm kiếm một nước với cửa sổ rỗng tại alpha;
+    # nếu không cần kết quả cố định thì alpha được nâng lên mỗi khi có kết quả tốt hơn và dùng cho các nước gửi sau
+    def root_split(self, board):
+        moves = self.order_moves(board, self.generate_move(board), 0, self.bot_mark, self.best_root_move)
+        if len(moves) < 2:
+            return self.negamax(board, 0, True, -SCORE_INF, SCORE_INF)
+        self.nodes += 1
+        x, y = moves[0]
+        self.position.play((x, y), self.bot_mark)
+        best_move = [x, y, -self.negamax(board, 1, False, -SCORE_INF, SCORE_INF)[2]]
+        self.position.undo()
+
+        pool = self.get_pool()
+        config = replace(self.config, workers=1, threat_nodes=0, opening_book=None)
+        results = {}
+        pending = {}
+        rest = iter(moves[1:])
+        # cờ hủy của các tiến trình con được bật khi cờ hủy của lần tìm kiếm này bị bật
+        shared_token = CancelToken(self.get_manager().Event()) if self.cancel_token is not None else None
+
+        def submit(move):
+            time_left = self.deadline - time.perf_counter() if self.deadline is not None else None
+            future = pool.submit(search_root_move, config, self.bot_mark, board, move, self.depth_limit,
+                                 best_move[2], time_left, shared_token)
+            pending[future] = move
+
+        # khi cần kết quả cố định thì gửi tất cả các nước cùng lúc với cùng một cận alpha
+        for move in islice(rest, len(moves) if self.config.deterministic else self.config.workers):
+            submit(move)
+        while pending:
+            # chờ có thời hạn để kiểm tra đồng hồ và cờ hủy cả khi chưa có tiến trình nào xong
+            done, _ = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            stop = self.should_stop()
+            for future in done:
+                move = pending.pop(future)
+                value, nodes = results[move] = future.result()
+                self.nodes += nodes
+                if value is None:
+                    stop = True
+                if stop:
+                    continue
+                if not self.config.deterministic:
+                    if value > best_move[2]:
+                        best_move = [move[0], move[1], value]
+                    move = next(rest, None)
+                    if move is not None:
+                        submit(move)
+            if stop:
+                # hết thời gian hoặc bị hủy thì hủy các nước chưa chạy và báo cho các nước đang chạy dừng lại
+                for other in pending:
+                    other.cancel()
+                if shared_token is not None:
+                    shared_token.cancel()
+                raise SearchTimeout()
+        if self.config.deterministic:
+            # chọn theo thứ tự sắp xếp để kết quả giống nhau giữa các lần chạy
+            for move in moves[1:]:
+                if results[move][0] > best_move[2]:
+                    best_move = [move[0], move[1], results[move][0]]
+        self.history[self.bot_mark][best_move[0]][best_move[1]] += self.depth_limit * self.depth_limit
+        return best_move
 
     # hàm in bàn cờ 
     def print_board(self, board):
+        size = self.config.board_size
         print('  ', end='')
-        for i in range(SIZE):
+        for i in range(size):
             print((i + 1) % 10, end=' ')
         print(*['', ' '], sep='\n', end='')
-        print((2 * SIZE + 1) * "-")
-        for i in range(SIZE):
+        print((2 * size + 1) * "-")
+        for i in range(size):
             print(*[(i + 1) % 10, "|"], sep='', end='')
-            for j in range(SIZE):
+            for j in range(size):
                 if board[i][j] == 0:
                     print(" ", end='|')
                 elif board[i][j] == 1:
@@ -373,13 +761,14 @@ class GomokuMinimax(GomokuAI):
                 else:
                     print("O", end='|')
             print(*['', ' '], sep='\n', end='')
-            print((2 * SIZE + 1) * "-")
+            print((2 * size + 1) * "-")
         print()
 
     def run(self):
         # khởi tạo một số dữ liệu
         # board[x][y] == 1 nếu là người chơi, == 2 nếu là máy
-        board = [[0 for i in range(SIZE)] for j in range(SIZE)]
+        size = self.config.board_size
+        board = [[0 for i in range(size)] for j in range(size)]
         game_complete = False
         player_turn = True
         cur_score = 0
@@ -407,7 +796,7 @@ class GomokuMinimax(GomokuAI):
                 except:
                     print("Sai lệnh!")
                     continue
-                if x < 1 or x > SIZE or y < 1 or y > SIZE:
+                if x < 1 or x > size or y < 1 or y > size:
                     print("Vị trí ngoài phạm vi, hãy thử lại!")
                     continue
                 if board[x - 1][y - 1] != 0:
@@ -447,3 +836,23 @@ class GomokuMinimax(GomokuAI):
                 else:
                     print("Player win!")
                     break
+
+
+# hàm chạy trong tiến trình con: tìm kiếm nước đi move của máy ở nút gốc tới độ sâu depth với cận dưới alpha,
+# trước hết với cửa sổ rỗng để chứng minh nước đi không tốt hơn alpha, nếu không được thì tìm điểm chính xác
+# trả về điểm của nước đi (None nếu hết thời gian time_left giây hoặc cancel_token bị bật) và số nút đã duyệt
+def search_root_move(config, bot_mark, board, move, depth, alpha, time_left, cancel_token=None):
+    engine = GomokuMinimax.from_config(config, bot_mark)
+    board = engine.prepare(board)
+    engine.depth_limit = depth
+    engine.cancel_token = cancel_token
+    if time_left is not None:
+        engine.deadline = time.perf_counter() + time_left
+    engine.position.play(move, bot_mark)
+    try:
+        value = -engine.negamax(board, 1, False, -alpha - 1, -alpha)[2]
+        if value > alpha:
+            value = -engine.negamax(board, 1, False, -SCORE_INF, -alpha)[2]
+    except SearchTimeout:
+        value = None
+    return value, engine.nodes
@@ -1,9 +1,65 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from multiprocessing import Manager
+
+POLL_INTERVAL = 0.05  # số giây giữa hai lần kiểm tra cờ hủy khi chờ kết quả của các tiến trình con
+
+
 class GomokuAI:
     name = None
+    mark_argument = None  # tên tham số nhận quân của máy trong hàm khởi tạo của engine
+    config = None  # cấu hình của engine, có trường workers nếu engine chạy được song song
+    pool = None  # nhóm tiến trình con dùng lại qua các nước đi khi workers > 1
+    manager = None  # tiến trình quản lý cờ hủy dùng chung với các tiến trình con, tạo khi cần
+
+    # tạo engine từ một cấu hình có sẵn
+    @classmethod
+    def from_config(cls, config, mark):
+        return cls(**{cls.mark_argument: mark}, **asdict(config))
 
-    def calculate_move(self, board):
+    def calculate_move(self, board, cancel_token=None):
         pass
 
+    # suy nghĩ trước trong lượt của đối thủ cho đến khi cancel_token bị bật, engine không hỗ trợ thì bỏ qua
+    def ponder(self, board, cancel_token):
+        pass
+
+    # nhóm tiến trình con, được tạo ở lần dùng đầu tiên
+    def get_pool(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.config.workers)
+        return self.pool
+
+    # tiến trình quản lý cờ hủy dùng chung, được tạo ở lần hủy được tìm kiếm song song đầu tiên
+    def get_manager(self):
+        if self.manager is None:
+            self.manager = Manager()
+        return self.manager
+
+    # đóng các tiến trình con (nếu có) khi không dùng engine nữa
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.manager is not None:
+            self.manager.shutdown()
+            self.manager = None
+
 
 class Human:
     name = "HUMAN"
+
+
+# cờ hủy dùng chung giữa luồng giao diện và luồng chạy engine: luồng giao diện bật cờ,
+# engine kiểm tra cờ trong lúc tìm kiếm và dừng sớm
+# nếu event là Event của multiprocessing.Manager thì cờ gửi được cho các tiến trình con
+class CancelToken:
+    def __init__(self, event=None):
+        self.event = event if event is not None else threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    def is_cancelled(self):
+        return self.event.is_set()
@@ -0,0 +1,210 @@
+import random
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from board_utils import DIRECTIONS, DRAW, IN_PROGRESS, CONSECUTIVE_MARKS_TO_WIN, get_neighbour_offsets, makes_five
+
+
+# đếm số quân mark liên tiếp tính từ ô kề (i, j) theo hướng (di, dj), không tính ô (i, j)
+def run_length(board, i, j, di, dj, mark):
+    rows, cols = len(board), len(board[0])
+    count = 0
+    i, j = i + di, j + dj
+    while 0 <= i < rows and 0 <= j < cols and board[i][j] == mark:
+        count += 1
+        i, j = i + di, j + dj
+    return count
+
+
+# bộ giả lập ván đấu ngẫu nhiên cho MCTS
+# mỗi lần giả lập giữ một danh sách nước đi ứng viên riêng (xóa bằng cách đổi chỗ với phần tử cuối) nên không cần
+# cập nhật rồi hoàn tác tập nước đi của engine, và chỉ kiểm tra thắng thua quanh nước vừa đánh
+# nếu dùng policy thì mỗi bên sẽ đánh nước thắng ngay nếu có, nếu không thì chặn nước thắng ngay của đối thủ,
+# còn lại thì đánh ngẫu nhiên gần các quân đã đánh
+class RolloutEngine:
+    def __init__(self, radius=1, policy=False, max_depth=None):
+        self.offsets = get_neighbour_offsets(radius)
+        self.policy = policy
+        self.max_depth = max_depth  # số nước tối đa của một lần giả lập, hết số nước mà chưa phân thắng bại thì tính hòa
+
+    # giả lập từ bàn cờ board với các nước đi ứng viên moves, player là người đi nước tiếp theo
+    # bàn cờ được trả về trạng thái ban đầu trước khi trả về kết quả
+    def run(self, board, moves, player, empty_count):
+        rows, cols = len(board), len(board[0])
+        candidates = list(moves)
+        index = {move: k for k, move in enumerate(candidates)}
+        # threats[p] là các ô mà nếu p đánh vào thì thắng ngay
+        threats = None
+        if self.policy:
+            threats = [None, set(), set()]
+            for i, j in candidates:
+                for mark in (1, 2):
+                    if makes_five(board, i, j, mark):
+                        threats[mark].add((i, j))
+
+        played = []
+        status = IN_PROGRESS if empty_count > 0 else DRAW
+        while status == IN_PROGRESS:
+            if not candidates or (self.max_depth is not None and len(played) >= self.max_depth):
+                status = DRAW
+                break
+            if threats is not None and threats[player]:
+                move = next(iter(threats[player]))
+            elif threats is not None and threats[3 - player]:
+                move = next(iter(threats[3 - player]))
+            else:
+                move = candidates[random.randrange(len(candidates))]
+            i, j = move
+            board[i][j] = player
+            played.append(move)
+            empty_count -= 1
+
+            # xóa nước vừa đánh khỏi danh sách ứng viên và thêm các ô trống lân cận
+            pos = index.pop(move)
+            last = candidates.pop()
+            if pos < len(candidates):
+                candidates[pos] = last
+                index[last] = pos
+            for di, dj in self.offsets:
+                i_, j_ = i + di, j + dj
+                if 0 <= i_ < rows and 0 <= j_ < cols and board[i_][j_] == 0 and (i_, j_) not in index:
+                    index[(i_, j_)] = len(candidates)
+                    candidates.append((i_, j_))
+
+            if threats is not None:
+                won = move in threats[player]
+                threats[1].discard(move)
+                threats[2].discard(move)
+                if not won:
+                    self.update_threats(board, i, j, player, threats[player])
+            else:
+                won = any(1 + run_length(board, i, j, di, dj, player) + run_length(board, i, j, -di, -dj, player)
+                          >= CONSECUTIVE_MARKS_TO_WIN for di, dj in DIRECTIONS)
+            if won:
+                status = player
+            elif empty_count == 0:
+                status = DRAW
+            player = 3 - player
+
+        for i, j in played:
+            board[i][j] = 0
+        return status
+
+    # sau khi player đánh vào (i, j), chỉ những ô trống đầu tiên ở hai phía của dãy quân chứa (i, j) trên mỗi hướng
+    # mới có thể trở thành ô thắng mới của player
+    @staticmethod
+    def update_threats(board, i, j, player, threats):
+        rows, cols = len(board), len(board[0])
+        for di, dj in DIRECTIONS:
+            for si, sj in ((di, dj), (-di, -dj)):
+                i_, j_ = i + si, j + sj
+                while 0 <= i_ < rows and 0 <= j_ < cols and board[i_][j_] == player:
+                    i_, j_ = i_ + si, j_ + sj
+                if 0 <= i_ < rows and 0 <= j_ < cols and board[i_][j_] == 0 and \
+                        1 + run_length(board, i_, j_, si, sj, player) + run_length(board, i_, j_, -si, -sj, player) \
+                        >= CONSECUTIVE_MARKS_TO_WIN:
+                    threats.add((i_, j_))
+
+
+# bộ giả lập theo lô dùng numpy: giả lập cùng lúc batch_size ván từ một bàn cờ, lưu dưới dạng mảng (K, N * N) int8
+# mỗi bước, mọi ván chưa kết thúc cùng đánh một nước ngẫu nhiên gần các quân đã đánh (lấy argmax của các khóa ngẫu
+# nhiên trên các ô được phép); tập ô gần quân đã đánh được cập nhật quanh nước vừa đánh, và chỉ kiểm tra 5 quân liên
+# tiếp trên bốn đường đi qua nước vừa đánh, như RolloutEngine
+class BatchRolloutEngine:
+    def __init__(self, batch_size=64, radius=1, max_depth=None, seed=None):
+        if np is None:
+            raise ImportError("numpy is required for batched rollouts")
+        self.batch_size = batch_size
+        self.radius = radius
+        self.max_depth = max_depth  # số nước tối đa của một lần giả lập, hết số nước mà chưa phân thắng bại thì tính hòa
+        self.rng = np.random.default_rng(seed)
+        self.tables = {}  # (số hàng, số cột) -> (bảng ô lân cận, bảng đường thắng), tạo ở lần dùng đầu tiên
+
+    # giả lập từ bàn cờ board, player là người đi nước tiếp theo
+    # trả về số ván [hòa, X thắng, O thắng]
+    def run(self, board, player, empty_count):
+        return self.run_many([board], [player], [empty_count])[0]
+
+    # giả lập batch_size ván từ mỗi bàn cờ trong boards cùng lúc, players[b] là người đi nước tiếp theo của bàn cờ b
+    # trả về danh sách số ván [hòa, X thắng, O thắng] của từng bàn cờ
+    def run_many(self, boards, players, empty_counts):
+        k = self.batch_size
+        games = np.repeat(np.array(boards, dtype=np.int8), k, axis=0)
+        count, rows, cols = games.shape
+        cells = rows * cols
+        neighbours, lines = self.get_tables(rows, cols)
+        # thêm một cột luôn trống làm ô ngoài bàn cờ cho bảng đường thắng
+        flat = np.zeros((count, cells + 1), dtype=np.int8)
+        flat[:, :cells] = games.reshape(count, cells)
+        near = self.near_stones(games != 0).reshape(count, cells) & (games.reshape(count, cells) == 0)
+        player = np.repeat(np.array(players, dtype=np.int8), k)
+        empty_count = np.repeat(np.array(empty_counts), k)
+        results = np.zeros(count, dtype=np.int8)
+        # chỉ số các ván chưa kết thúc, mỗi bước chỉ tính trên các ván này
+        playing = np.flatnonzero(empty_count > 0)
+        n = CONSECUTIVE_MARKS_TO_WIN
+        depth = 0
+        while playing.size > 0 and (self.max_depth is None or depth < self.max_depth):
+            allowed = near[playing]
+            # ván nào không có ô trống gần quân đã đánh thì chọn trong tất cả các ô trống
+            isolated = ~allowed.any(axis=1)
+            if isolated.any():
+                allowed[isolated] = flat[playing[isolated], :cells] == 0
+            keys = self.rng.random(allowed.shape)
+            keys[~allowed] = -1
+            moves = keys.argmax(axis=1)
+            mover = player[playing]
+            flat[playing, moves] = mover
+
+            # các ô lân cận của nước vừa đánh trở thành ô gần nếu còn trống (ô vừa đánh đã có quân nên bị bỏ ra)
+            around = neighbours[moves]
+            near[playing[:, np.newaxis], around] = flat[playing[:, np.newaxis], around] == 0
+            near[playing, moves] = False
+
+            # thắng nếu có n ô liên tiếp của người vừa đi trên một trong 2n - 1 ô của một đường qua nước vừa đánh
+            stones = flat[playing[:, np.newaxis, np.newaxis], lines[moves]] == mover[:, np.newaxis, np.newaxis]
+            five = stones[:, :, :n].copy()
+            for step in range(1, n):
+                five &= stones[:, :, step:step + n]
+            won = five.any(axis=(1, 2))
+            results[playing[won]] = mover[won]
+            empty_count[playing] -= 1
+            player[playing] = 3 - mover
+            playing = playing[~won & (empty_count[playing] > 0)]
+            depth += 1
+        return [np.bincount(row, minlength=3).tolist() for row in results.reshape(len(boards), k)]
+
+    # bảng chỉ số phẳng của các ô lân cận bán kính radius của mỗi ô (ô ngoài bàn cờ thay bằng chính ô đó)
+    # và của 2 * CONSECUTIVE_MARKS_TO_WIN - 1 ô trên mỗi đường qua mỗi ô theo bốn hướng (ô ngoài bàn cờ là cột thêm)
+    def get_tables(self, rows, cols):
+        tables = self.tables.get((rows, cols))
+        if tables is None:
+            cells = rows * cols
+            i, j = np.divmod(np.arange(cells), cols)
+            offsets = np.array(get_neighbour_offsets(self.radius))
+            ni, nj = i[:, np.newaxis] + offsets[:, 0], j[:, np.newaxis] + offsets[:, 1]
+            inside = (ni >= 0) & (ni < rows) & (nj >= 0) & (nj < cols)
+            neighbours = np.where(inside, ni * cols + nj, np.arange(cells)[:, np.newaxis])
+            n = CONSECUTIVE_MARKS_TO_WIN
+            steps = np.arange(-(n - 1), n)
+            directions = np.array(DIRECTIONS)
+            li = i[:, np.newaxis, np.newaxis] + directions[:, 0, np.newaxis] * steps
+            lj = j[:, np.newaxis, np.newaxis] + directions[:, 1, np.newaxis] * steps
+            inside = (li >= 0) & (li < rows) & (lj >= 0) & (lj < cols)
+            lines = np.where(inside, li * cols + lj, cells)
+            tables = self.tables[(rows, cols)] = (neighbours, lines)
+        return tables
+
+    # các ô nằm trong vùng lân cận bán kính radius của ít nhất một quân cờ
+    def near_stones(self, occupied):
+        r = self.radius
+        rows, cols = occupied.shape[1:]
+        padded = np.pad(occupied, ((0, 0), (r, r), (r, r)))
+        near = np.zeros_like(occupied)
+        for di in range(2 * r + 1):
+            for dj in range(2 * r + 1):
+                near |= padded[:, di:di + rows, dj:dj + cols]
+        return near
@@ -0,0 +1,158 @@
+import argparse
+import os
+import struct
+
+from board_utils import canonical_hash, transform_move, INVERSE_SYMMETRY, get_potential_moves, clone_board
+
+X, O = 1, 2
+
+# sách khai cuộc không có sẵn trong mã nguồn, cần xây một lần trước khi dùng (engine tự bỏ qua nếu chưa có file):
+#   python opening_book.py --size 15 --plies 4 --engine minimax --depth 4
+# file được ghi ra DEFAULT_BOOK_PATH (hoặc --output), chạy lại với kích cỡ khác sẽ thêm vào file đã có
+DEFAULT_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opening_book.bin')
+BOOK_MAGIC = b'GMKB'
+BOOK_VERSION = 1
+# định dạng file: phần đầu gồm mã nhận dạng, phiên bản, số thế cờ; sau đó là các bản ghi sắp xếp theo mã băm,
+# mỗi bản ghi 12 byte gồm mã băm chính tắc 64 bit, số hàng, số cột và nước đi (hàng, cột) trong hệ tọa độ chính tắc
+HEADER = struct.Struct('<4sHI')
+RECORD = struct.Struct('<QBBBB')
+
+
+# sách khai cuộc: ánh xạ từ thế cờ (chuẩn hóa theo 8 phép đối xứng của bàn cờ) tới nước đi đã tính sẵn
+# file chỉ được đọc ở lần tra cứu đầu tiên, không có file thì sách rỗng
+class OpeningBook:
+    def __init__(self, path=DEFAULT_BOOK_PATH):
+        self.path = path
+        self.entries = None  # (số hàng, số cột, mã băm chính tắc) -> nước đi chính tắc
+
+    def __len__(self):
+        if self.entries is None:
+            self.load()
+        return len(self.entries)
+
+    def load(self):
+        self.entries = {}
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        magic, version, count = HEADER.unpack_from(data)
+        if magic != BOOK_MAGIC or version != BOOK_VERSION:
+            raise ValueError(f'{self.path} is not an opening book of version {BOOK_VERSION}')
+        for key, rows, cols, i, j in RECORD.iter_unpack(data[HEADER.size:HEADER.size + count * RECORD.size]):
+            self.entries[(rows, cols, key)] = (i, j)
+
+    def save(self, path=None):
+        if self.entries is None:
+            self.load()
+        with open(path or self.path, 'wb') as f:
+            f.write(HEADER.pack(BOOK_MAGIC, BOOK_VERSION, len(self.entries)))
+            for (rows, cols, key), (i, j) in sorted(self.entries.items(), key=lambda entry: entry[0][2]):
+                f.write(RECORD.pack(key, rows, cols, i, j))
+
+    # tra cứu nước đi cho bàn cờ, trả về None nếu thế cờ không có trong sách
+    def lookup(self, board):
+        if self.entries is None:
+            self.load()
+        if not self.entries:
+            return None
+        rows, cols = len(board), len(board[0])
+        key, symmetry = canonical_hash(board)
+        move = self.entries.get((rows, cols, key))
+        if move is None:
+            return None
+        # đưa nước đi từ hệ tọa độ chính tắc về hệ tọa độ của bàn cờ đầu vào
+        i, j = transform_move(move, INVERSE_SYMMETRY[symmetry], rows, cols)
+        return (i, j) if board[i][j] == 0 else None
+
+    # thêm nước đi move (theo hệ tọa độ của board) cho thế cờ board
+    def add(self, board, move):
+        if self.entries is None:
+            self.load()
+        rows, cols = len(board), len(board[0])
+        key, symmetry = canonical_hash(board)
+        self.entries[(rows, cols, key)] = transform_move(move, symmetry, rows, cols)
+
+    def __contains__(self, board):
+        if self.entries is None:
+            self.load()
+        return (len(board), len(board[0]), canonical_hash(board)[0]) in self.entries
+
+
+_OPENING_BOOKS = {}
+
+
+# lấy sách khai cuộc theo đường dẫn, mỗi file chỉ đọc một lần trong một tiến trình
+def get_opening_book(path):
+    book = _OPENING_BOOKS.get(path)
+    if book is None:
+        book = _OPENING_BOOKS[path] = OpeningBook(path)
+    return book
+
+
+# xây sách khai cuộc: bắt đầu từ các thế cờ một quân (khác nhau về đối xứng) mà engine có thể tự đánh ở nước đầu,
+# với mỗi thế cờ thì tính nước đi bằng engine do make_engine(người đi) tạo ra rồi lưu vào sách,
+# sau đó đi tiếp bằng nước đi đó và thêm breadth nước đi khác gần tâm bàn cờ nhất (các nước đối thủ có thể đánh),
+# cho đến khi thế cờ có plies quân (thế cờ sâu nhất trong sách có plies quân)
+def build_book(book, board_size, plies, breadth, make_engine, padding=1, logging=True):
+    positions = []
+    seen = set()
+    for i in range(padding, board_size - padding):
+        for j in range(padding, board_size - padding):
+            board = [[0] * board_size for _ in range(board_size)]
+            board[i][j] = X
+            key = canonical_hash(board)[0]
+            if key not in seen:
+                seen.add(key)
+                positions.append(board)
+
+    center = (board_size - 1) / 2
+    for ply in range(1, plies + 1):
+        next_positions = []
+        for board in positions:
+            player = X if ply % 2 == 0 else O
+            if board not in book:
+                book.add(board, tuple(make_engine(player).calculate_move(board)[:2]))
+            if ply == plies:
+                continue
+            move = book.lookup(board)
+            others = sorted((m for m in get_potential_moves(board) if m != move),
+                            key=lambda m: max(abs(m[0] - center), abs(m[1] - center)))
+            for reply in [move] + others[:breadth]:
+                child = clone_board(board)
+                child[reply[0]][reply[1]] = player
+                key = canonical_hash(child)[0]
+                if key not in seen:
+                    seen.add(key)
+                    next_positions.append(child)
+        positions = next_positions
+        if logging:
+            print(f'ply {ply}: {len(book)} positions in book')
+    return book
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a Gomoku opening book with one of the engines')
+    parser.add_argument('--size', type=int, default=15, help='board size')
+    parser.add_argument('--plies', type=int, default=4, help='number of stones of the deepest book position')
+    parser.add_argument('--breadth', type=int, default=2, help='alternative replies expanded per position')
+    parser.add_argument('--engine', choices=['minimax', 'mcts'], default='minimax')
+    parser.add_argument('--depth', type=int, default=4, help='minimax search depth')
+    parser.add_argument('--time-ms', type=int, default=None, help='time budget per move (milliseconds)')
+    parser.add_argument('--simulations', type=int, default=20000, help='MCTS simulations per move')
+    parser.add_argument('--output', default=DEFAULT_BOOK_PATH)
+    args = parser.parse_args()
+
+    if args.engine == 'minimax':
+        from gomoku_minimax import GomokuMinimax
+
+        def make_engine(player):
+            return GomokuMinimax(args.size, player, args.depth, time_budget_ms=args.time_ms, opening_book=None)
+    else:
+        from gomoku_mcts import GomokuMCTS
+
+        def make_engine(player):
+            return GomokuMCTS(player, args.simulations, time_budget_ms=args.time_ms, opening_book=None)
+
+    # thêm vào sách có sẵn (nếu có) ở đường dẫn đầu ra
+    build_book(OpeningBook(args.output), args.size, args.plies, args.breadth, make_engine).save()
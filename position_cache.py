@@ -0,0 +1,73 @@
+import os
+import pickle
+from collections import OrderedDict
+
+from board_utils import canonical_hash, transform_move, INVERSE_SYMMETRY, is_empty
+
+CACHE_CAPACITY = 100000  # số thế cờ tối đa trong bộ nhớ đệm mặc định
+
+
+# bộ nhớ đệm LRU cho kết quả tính nước đi của các engine
+# khóa gồm cấu hình engine và mã băm chính tắc của bàn cờ, nên các thế cờ đối xứng với nhau dùng chung một kết quả;
+# nước đi được lưu trong hệ tọa độ chính tắc và được đưa về hệ tọa độ của bàn cờ khi tra cứu
+# nếu có path thì có thể đọc / ghi bộ nhớ đệm ra file để dùng lại giữa các lần chạy
+class PositionCache:
+    def __init__(self, capacity=CACHE_CAPACITY, path=None):
+        self.capacity = capacity
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def make_key(board, engine_key):
+        key, symmetry = canonical_hash(board)
+        return (engine_key, len(board), len(board[0]), key), symmetry
+
+    # tra cứu kết quả của engine có khóa engine_key cho bàn cờ board, trả về None nếu chưa có
+    # bàn cờ rỗng không được lưu vì nước đi đầu tiên của các engine là ngẫu nhiên
+    def get(self, board, engine_key):
+        if is_empty(board):
+            return None
+        key, symmetry = self.make_key(board, engine_key)
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        move = transform_move(result[:2], INVERSE_SYMMETRY[symmetry], len(board), len(board[0]))
+        return [*move, *result[2:]]
+
+    # lưu kết quả result (theo hệ tọa độ của board) của engine có khóa engine_key
+    def put(self, board, engine_key, result):
+        if is_empty(board):
+            return
+        key, symmetry = self.make_key(board, engine_key)
+        move = transform_move(result[:2], symmetry, len(board), len(board[0]))
+        self.entries[key] = [*move, *result[2:]]
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0
+
+    def stats(self):
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate()}
+
+    def load(self, path=None):
+        with open(path or self.path, 'rb') as f:
+            self.entries = OrderedDict(pickle.load(f))
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def save(self, path=None):
+        with open(path or self.path, 'wb') as f:
+            pickle.dump(list(self.entries.items()), f)
@@ -0,0 +1,191 @@
+from board_utils import DIRECTIONS, CONSECUTIVE_MARKS_TO_WIN, makes_five
+
+THREAT_NODES = 2000  # số nút tối đa của một lần tìm kiếm đe dọa mặc định
+THREAT_DEPTH = 12  # số nước tấn công tối đa của một chuỗi thắng
+
+# 8 hướng đi từ một ô
+LINE_STEPS = DIRECTIONS + [(-di, -dj) for di, dj in DIRECTIONS]
+
+
+# giá trị của 2 * CONSECUTIVE_MARKS_TO_WIN - 1 ô trên đường qua (i, j) theo hướng (di, dj) với (i, j) ở giữa,
+# ô nằm ngoài bàn cờ có giá trị -1
+def line_values(board, i, j, di, dj):
+    rows, cols = len(board), len(board[0])
+    values = []
+    for k in range(1 - CONSECUTIVE_MARKS_TO_WIN, CONSECUTIVE_MARKS_TO_WIN):
+        a, b = i + k * di, j + k * dj
+        values.append(board[a][b] if 0 <= a < rows and 0 <= b < cols else -1)
+    return values
+
+
+# các ô trống mà nếu player đánh vào thì có đủ quân liên tiếp để thắng,
+# chỉ xét các cửa sổ CONSECUTIVE_MARKS_TO_WIN ô chứa ô (i, j)
+def five_cells(board, i, j, player):
+    n = CONSECUTIVE_MARKS_TO_WIN
+    result = set()
+    for di, dj in DIRECTIONS:
+        values = line_values(board, i, j, di, dj)
+        for start in range(n):
+            window = values[start:start + n]
+            if window.count(player) == n - 1 and 0 in window:
+                k = start + window.index(0) + 1 - n
+                result.add((i + k * di, j + k * dj))
+    return result
+
+
+# số quân player nhiều nhất trong một cửa sổ CONSECUTIVE_MARKS_TO_WIN ô chứa ô (i, j) và không có quân đối thủ
+def window_count(board, i, j, player):
+    n = CONSECUTIVE_MARKS_TO_WIN
+    best = 0
+    for di, dj in DIRECTIONS:
+        values = line_values(board, i, j, di, dj)
+        for start in range(n):
+            window = values[start:start + n]
+            if 3 - player not in window and -1 not in window:
+                best = max(best, window.count(player))
+    return best
+
+
+# các ô trống nằm trên 8 hướng, cách một trong các quân stones không quá CONSECUTIVE_MARKS_TO_WIN - 1 ô
+def line_cells(board, stones):
+    rows, cols = len(board), len(board[0])
+    result = set()
+    for i, j in stones:
+        for di, dj in LINE_STEPS:
+            for k in range(1, CONSECUTIVE_MARKS_TO_WIN):
+                a, b = i + k * di, j + k * dj
+                if not (0 <= a < rows and 0 <= b < cols):
+                    break
+                if board[a][b] == 0:
+                    result.add((a, b))
+    return sorted(result)
+
+
+# tìm kiếm không gian đe dọa: chỉ xét các nước đi tạo thành 4 (VCF - thắng bằng các nước 4 liên tiếp)
+# và nếu dùng use_vct thì cả các nước tạo thành 3 mở (VCT), nên số nhánh rất nhỏ và có thể tìm được
+# chuỗi thắng dài hơn nhiều so với độ sâu của minimax
+# các nước của bên phòng thủ chỉ là các nước chặn bắt buộc, nên chuỗi tìm được luôn thắng dù đối thủ đánh thế nào
+class ThreatSearch:
+    def __init__(self, max_nodes=THREAT_NODES, max_depth=THREAT_DEPTH, use_vct=False):
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.use_vct = use_vct
+        self.nodes = 0  # số nút đã duyệt ở lần tìm kiếm gần nhất
+        self.should_stop = None  # hàm kiểm tra hết thời gian / bị hủy của lần tìm kiếm hiện tại
+        self.stopped = False
+
+    # tìm chuỗi nước đi thắng cho player (người đi tiếp theo) trên bàn cờ board
+    # trả về danh sách nước đi xen kẽ của hai bên bắt đầu bằng nước của player, hoặc None nếu không tìm được
+    # bàn cờ được trả về trạng thái ban đầu sau khi tìm kiếm
+    # nếu có should_stop thì hàm này được gọi ở mỗi nút, trả về True thì dừng tìm kiếm và coi như không tìm được
+    def search(self, board, player, should_stop=None):
+        self.nodes = 0
+        self.should_stop = should_stop
+        self.stopped = False
+        opponent = 3 - player
+        stones = [(i, j) for i in range(len(board)) for j in range(len(board[i])) if board[i][j] == player]
+        opponent_stones = [(i, j) for i in range(len(board)) for j in range(len(board[i])) if board[i][j] == opponent]
+        for i, j in line_cells(board, stones):
+            if makes_five(board, i, j, player):
+                return [(i, j)]
+        # đối thủ đang có nước thắng ngay thì không thể tấn công
+        for i, j in line_cells(board, opponent_stones):
+            if makes_five(board, i, j, opponent):
+                return None
+        return self.attack(board, player, stones, opponent_stones, [], self.max_depth)
+
+    # lượt của bên tấn công: stones là các quân của bên tấn công, blocks là các nước chặn của bên phòng thủ
+    # trong chuỗi hiện tại (chỉ những quân này mới có thể tạo ra nước thắng ngay cho bên phòng thủ)
+    def attack(self, board, attacker, stones, defender_stones, blocks, depth):
+        self.nodes += 1
+        if depth == 0 or self.nodes > self.max_nodes or self.out_of_time():
+            return None
+        defender = 3 - attacker
+        for i, j in blocks:
+            if five_cells(board, i, j, defender):
+                return None
+        # nước 3 chỉ buộc đối thủ phải chặn nếu đối thủ không có nước 4 để phản công
+        use_threes = self.use_vct and not self.has_four_move(board, defender, defender_stones)
+
+        # xét trước các ô nằm trong cửa sổ có nhiều quân của bên tấn công
+        candidates = sorted(line_cells(board, stones), key=lambda move: -window_count(board, *move, attacker))
+        for i, j in candidates:
+            if self.stopped:
+                break
+            if window_count(board, i, j, attacker) < CONSECUTIVE_MARKS_TO_WIN - (3 if use_threes else 2):
+                break
+            board[i][j] = attacker
+            fives = five_cells(board, i, j, attacker)
+            result = None
+            if len(fives) >= 2:
+                # 4 mở hoặc 4 kép, đối thủ không chặn được
+                result = [(i, j)]
+            elif fives:
+                block = fives.pop()
+                board[block[0]][block[1]] = defender
+                line = self.attack(board, attacker, stones + [(i, j)], defender_stones + [block], blocks + [block],
+                                   depth - 1)
+                board[block[0]][block[1]] = 0
+                if line is not None:
+                    result = [(i, j), block] + line
+            elif use_threes and window_count(board, i, j, attacker) >= CONSECUTIVE_MARKS_TO_WIN - 2 \
+                    and self.open_four_cells(board, i, j, attacker):
+                result = self.defend_three(board, attacker, (i, j), stones, defender_stones, blocks, depth)
+            board[i][j] = 0
+            if result is not None:
+                return result
+        return None
+
+    # bên tấn công vừa tạo 3 mở tại move: thử mọi nước chặn làm mất các ô tạo 4 mở,
+    # chuỗi thắng khi bên tấn công vẫn thắng được sau mọi nước chặn đó
+    # (đối thủ không có nước 4 nên nước đi ở nơi khác không ngăn được 4 mở)
+    def defend_three(self, board, attacker, move, stones, defender_stones, blocks, depth):
+        defender = 3 - attacker
+        i, j = move
+        principal = None
+        for a, b in line_cells(board, [move]):
+            board[a][b] = defender
+            line = None
+            effective = not self.open_four_cells(board, i, j, attacker)
+            if effective:
+                line = self.attack(board, attacker, stones + [move], defender_stones + [(a, b)], blocks + [(a, b)],
+                                   depth - 1)
+            board[a][b] = 0
+            if effective:
+                if line is None:
+                    return None
+                if principal is None:
+                    principal = [(a, b)] + line
+        return [move] + (principal or [])
+
+    # các ô trên các đường qua (i, j) mà nếu player đánh vào thì tạo thành 4 mở hoặc 4 kép
+    def open_four_cells(self, board, i, j, player):
+        self.nodes += 1
+        result = []
+        if self.out_of_time():
+            return result
+        for a, b in line_cells(board, [(i, j)]):
+            if window_count(board, a, b, player) < CONSECUTIVE_MARKS_TO_WIN - 2:
+                continue
+            board[a][b] = player
+            if len(five_cells(board, a, b, player)) >= 2:
+                result.append((a, b))
+            board[a][b] = 0
+        return result
+
+    # kiểm tra should_stop (nếu có), khi đã dừng thì mọi nút sau đó đều trả về ngay
+    def out_of_time(self):
+        if not self.stopped and self.should_stop is not None and self.should_stop():
+            self.stopped = True
+        return self.stopped
+
+    # player có nước đi nào tạo thành 4 hay không
+    @staticmethod
+    def has_four_move(board, player, stones):
+        for i, j in line_cells(board, stones):
+            board[i][j] = player
+            four = bool(five_cells(board, i, j, player))
+            board[i][j] = 0
+            if four:
+                return True
+        return False